@@ -0,0 +1,182 @@
+#  Copyright (c) 2020 — present, Kirill M.
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+"""Compares the old plpgsql get_infractions function with the fixed queries of Infractions.search.
+
+Everything is created in a throwaway schema of a local database, which is dropped afterwards:
+
+    python -m benchmarks.infractions_search --rows 1000000 --runs 200
+"""
+
+from __future__ import annotations
+
+import time
+import asyncio
+import argparse
+import statistics
+from typing import Any, Dict, List, Tuple
+
+import asyncpg
+
+import config
+from tomodachi.core.infractions import SEARCH_QUERIES
+
+SCHEMA = "bench_infractions"
+
+SETUP = """
+CREATE SCHEMA {schema};
+SET search_path TO {schema};
+
+CREATE TABLE infractions
+(
+    id         bigint generated always as identity (start with 1000) primary key,
+    action_id  bigint,
+    inf_type   text,
+    created_at timestamptz default CURRENT_TIMESTAMP,
+    expires_at timestamptz default CURRENT_TIMESTAMP,
+    guild_id   bigint,
+    mod_id     bigint,
+    target_id  bigint,
+    reason     text
+);
+"""
+
+SEED = """
+INSERT INTO infractions (inf_type, guild_id, mod_id, target_id, reason)
+SELECT 'PERMABAN', n % $1, n % ($1 * 5), (random() * $2)::bigint, 'Benchmark reason #' || n
+FROM generate_series(1, $3) AS n;
+"""
+
+OLD_SCHEMA = """
+CREATE INDEX infractions_guild_id_mod_id_target_id_idx ON infractions (guild_id, mod_id, target_id);
+
+CREATE FUNCTION get_infractions(_guild_id bigint, _inf_id bigint, _target_id bigint, _mod_id bigint)
+    RETURNS SETOF infractions
+    LANGUAGE plpgsql
+AS
+$$
+DECLARE
+    _sql text;
+BEGIN
+    _sql := format('select * from infractions i where i.guild_id = %L', _guild_id);
+    IF _inf_id IS NOT NULL THEN
+        _sql := _sql || format(' and i.id = %L ', _inf_id);
+    END IF;
+    IF _target_id IS NOT NULL THEN
+        _sql := _sql || format(' and i.target_id = %L ', _target_id);
+    END IF;
+    IF _mod_id IS NOT NULL THEN
+        _sql := _sql || format(' and i.mod_id = %L ', _mod_id);
+    END IF;
+    _sql := _sql || ' limit 500;';
+
+    RETURN QUERY EXECUTE _sql;
+END;
+$$;
+
+ANALYZE infractions;
+"""
+
+NEW_SCHEMA = """
+DROP FUNCTION get_infractions;
+DROP INDEX infractions_guild_id_mod_id_target_id_idx;
+
+CREATE INDEX infractions_guild_id_id_idx ON infractions (guild_id, id desc);
+CREATE INDEX infractions_guild_id_target_id_id_idx ON infractions (guild_id, target_id, id desc);
+CREATE INDEX infractions_guild_id_mod_id_id_idx ON infractions (guild_id, mod_id, id desc);
+
+ANALYZE infractions;
+"""
+
+
+def make_cases(sample: asyncpg.Record) -> Dict[str, Dict[str, Any]]:
+    _, target_id, mod_id, inf_id = sample
+    return {
+        "guild": {},
+        "target": {"target_id": target_id},
+        "mod": {"mod_id": mod_id},
+        "target+mod": {"target_id": target_id, "mod_id": mod_id},
+        "id": {"id": inf_id},
+    }
+
+
+def old_query(guild_id: int, filters: Dict[str, Any]) -> Tuple[str, List[Any]]:
+    args = [guild_id, filters.get("id"), filters.get("target_id"), filters.get("mod_id")]
+    return "SELECT * FROM get_infractions($1, $2, $3, $4);", args
+
+
+def old_plan_query(guild_id: int, filters: Dict[str, Any]) -> Tuple[str, List[Any]]:
+    # the function hides its plan, so the text it would execute is explained instead
+    conditions = ["guild_id = $1", *(f"{name} = ${n}" for n, name in enumerate(filters, start=2))]
+    return f"SELECT * FROM infractions WHERE {' AND '.join(conditions)} LIMIT 500;", [guild_id, *filters.values()]
+
+
+def new_query(guild_id: int, filters: Dict[str, Any]) -> Tuple[str, List[Any]]:
+    return SEARCH_QUERIES[tuple(filters)], [guild_id, *filters.values(), 500]
+
+
+async def measure(conn: asyncpg.Connection, query: str, args: List[Any], runs: int) -> List[float]:
+    timings = []
+    for _ in range(runs):
+        started_at = time.perf_counter()
+        await conn.fetch(query, *args)
+        timings.append((time.perf_counter() - started_at) * 1000)
+    return timings
+
+
+async def explain(conn: asyncpg.Connection, query: str, args: List[Any]) -> str:
+    rows = await conn.fetch(f"EXPLAIN (ANALYZE, BUFFERS) {query}", *args)
+    return "\n".join(f"    {row[0]}" for row in rows)
+
+
+async def run_cases(conn: asyncpg.Connection, label: str, make_query, plan_query, sample: asyncpg.Record, runs: int):
+    print(f"\n=== {label} ===")
+    guild_id = sample["guild_id"]
+
+    for name, filters in make_cases(sample).items():
+        query, args = make_query(guild_id, filters)
+        timings = await measure(conn, query, args, runs)
+        quantiles = statistics.quantiles(timings, n=100)
+        print(f"\n{name}: p50 {quantiles[49]:.3f}ms, p95 {quantiles[94]:.3f}ms, p99 {quantiles[98]:.3f}ms")
+        print(await explain(conn, *plan_query(guild_id, filters)))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", default=config.POSTGRES_DSN)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--guilds", type=int, default=1_000)
+    parser.add_argument("--targets", type=int, default=100_000)
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+
+    conn = await asyncpg.connect(args.dsn)
+    try:
+        print(f"seeding {args.rows} infractions across {args.guilds} guilds...")
+        await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+        await conn.execute(SETUP.format(schema=SCHEMA))
+        await conn.execute(SEED, args.guilds, args.targets, args.rows)
+
+        # the busiest guild and one of its regulars make the worst case for every filter
+        sample = await conn.fetchrow(
+            """SELECT guild_id, target_id, mod_id, id
+            FROM infractions
+            WHERE guild_id = (SELECT guild_id FROM infractions GROUP BY guild_id ORDER BY count(*) DESC LIMIT 1)
+            ORDER BY id
+            LIMIT 1;"""
+        )
+
+        await conn.execute(OLD_SCHEMA)
+        await run_cases(conn, "before", old_query, old_plan_query, sample, args.runs)
+
+        await conn.execute(NEW_SCHEMA)
+        await run_cases(conn, "after", new_query, new_query, sample, args.runs)
+    finally:
+        await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -33,5 +33,9 @@ POSTGRES_CREDENTIALS = {
 }
 POSTGRES_DSN = "postgresql://{user}:{password}@{host}:{port}/{database}".format(**POSTGRES_CREDENTIALS)
 
+# Prometheus metrics are served on http://METRICS_HOST:METRICS_PORT/metrics, set port to None to disable it
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9100
+
 EXTENSIONS = ("default",)
 JISHAKU_FLAGS = ("HIDE",)
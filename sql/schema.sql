@@ -64,35 +64,95 @@ create table if not exists public.infractions
 create index infractions_action_id_idx
     on public.infractions (action_id);
 
-create index infractions_guild_id_mod_id_target_id_idx
-    on public.infractions (guild_id, mod_id, target_id);
+-- every search is ordered by id, newest first, and filtered by guild plus optionally target or moderator
+create index infractions_guild_id_id_idx
+    on public.infractions (guild_id, id desc);
 
+create index infractions_guild_id_target_id_id_idx
+    on public.infractions (guild_id, target_id, id desc);
+
+create index infractions_guild_id_mod_id_id_idx
+    on public.infractions (guild_id, mod_id, id desc);
+
+-- replaced by fixed queries in the bot, which can be prepared and planned once
 drop function if exists get_infractions;
+drop index if exists infractions_guild_id_mod_id_target_id_idx;
 
-create or replace function get_infractions(_guild_id bigint, _inf_id bigint, _target_id bigint, _mod_id bigint)
-    returns setof infractions
+-- infraction counters, maintained by a trigger in the same transaction as every insert or delete of infractions
+create table if not exists public.infraction_counts
+(
+    guild_id  bigint,
+    target_id bigint,
+    inf_type  infractiontype,
+    count     integer not null default 0,
+
+    primary key (guild_id, target_id, inf_type)
+);
+
+create table if not exists public.moderator_counts
+(
+    guild_id bigint,
+    mod_id   bigint,
+    count    integer not null default 0,
+
+    primary key (guild_id, mod_id)
+);
+
+create or replace function count_infraction()
+    returns trigger
     language plpgsql
 as
 $$
 declare
-    _sql text;
+    _row   infractions;
+    _delta integer;
 begin
-    _sql := format('select * from infractions i where i.guild_id = %L', _guild_id);
-    if _inf_id is not null then
-        _sql := _sql || format(' and i.id = %L ', _inf_id);
+    if tg_op = 'DELETE' then
+        _row := old;
+        _delta := -1;
+    else
+        _row := new;
+        _delta := 1;
     end if;
-    if _target_id is not null then
-        _sql := _sql || format(' and i.target_id = %L ', _target_id);
+
+    -- columns of infractions are nullable, rows without a key aren't counted rather than failing the write
+    if _row.guild_id is not null and _row.target_id is not null and _row.inf_type is not null then
+        insert into infraction_counts (guild_id, target_id, inf_type, count)
+        values (_row.guild_id, _row.target_id, _row.inf_type, _delta)
+        on conflict (guild_id, target_id, inf_type) do update set count = infraction_counts.count + excluded.count;
     end if;
-    if _mod_id is not null then
-        _sql := _sql || format(' and i.mod_id = %L ', _mod_id);
+
+    if _row.guild_id is not null and _row.mod_id is not null then
+        insert into moderator_counts (guild_id, mod_id, count)
+        values (_row.guild_id, _row.mod_id, _delta)
+        on conflict (guild_id, mod_id) do update set count = moderator_counts.count + excluded.count;
     end if;
-    _sql := _sql || ' limit 500;';
 
-    return query execute _sql;
+    return null;
 end;
 $$;
 
+create trigger infractions_count_infraction
+    after insert or delete
+    on public.infractions
+    for each row
+execute function count_infraction();
+
+-- backfill of infractions stored before the counters existed
+insert into infraction_counts (guild_id, target_id, inf_type, count)
+select guild_id, target_id, inf_type, count(*)
+from infractions
+where guild_id is not null and target_id is not null and inf_type is not null
+group by guild_id, target_id, inf_type
+on conflict (guild_id, target_id, inf_type) do update set count = excluded.count;
+
+insert into moderator_counts (guild_id, mod_id, count)
+select guild_id, mod_id, count(*)
+from infractions
+where guild_id is not null and mod_id is not null
+group by guild_id, mod_id
+on conflict (guild_id, mod_id) do update set count = excluded.count;
+
 -- mod_settings
 create table if not exists public.mod_settings
 (
@@ -124,3 +184,70 @@ create table if not exists public.logging
 
 create index logging_guild_id_idx
     on public.logging (guild_id);
+
+-- cache coherence, every change of settings or blacklist is announced to listening bot processes,
+-- inserted settings only hold defaults and can't be cached anywhere yet, so they aren't announced
+create or replace function notify_settings_change()
+    returns trigger
+    language plpgsql
+as
+$$
+begin
+    if tg_op = 'DELETE' then
+        perform pg_notify('settings', json_build_object('guild_id', old.guild_id)::text);
+        return old;
+    end if;
+
+    perform pg_notify('settings', row_to_json(new)::text);
+    return new;
+end;
+$$;
+
+create trigger guilds_notify_settings
+    after update or delete
+    on public.guilds
+    for each row
+execute function notify_settings_change();
+
+create trigger mod_settings_notify_settings
+    after update or delete
+    on public.mod_settings
+    for each row
+execute function notify_settings_change();
+
+create or replace function notify_blacklist_change()
+    returns trigger
+    language plpgsql
+as
+$$
+begin
+    if tg_op = 'DELETE' then
+        perform pg_notify('blacklist', json_build_object('op', 'remove', 'user_id', old.user_id)::text);
+        return old;
+    end if;
+
+    perform pg_notify('blacklist', json_build_object('op', 'add', 'user_id', new.user_id)::text);
+    return new;
+end;
+$$;
+
+create trigger blacklisted_notify_blacklist
+    after insert or update or delete
+    on public.blacklisted
+    for each row
+execute function notify_blacklist_change();
+
+-- keyset scans of the scheduler window
+create index actions_trigger_at_id_idx
+    on public.actions (trigger_at, id);
+
+-- per-shard scheduler windows, the expression and the name have to use SHARD_COUNT from config, 1 by default.
+-- after changing the shard count, build the new index before starting the bot and drop the old one:
+--   create index concurrently actions_shard<N>_trigger_at_id_idx on public.actions (((guild_id >> 22) % <N>), trigger_at, id);
+--   drop index concurrently actions_shard<OLD N>_trigger_at_id_idx;
+create index actions_shard1_trigger_at_id_idx
+    on public.actions (((guild_id >> 22) % 1), trigger_at, id);
+
+create index actions_guildless_trigger_at_id_idx
+    on public.actions (trigger_at, id)
+    where guild_id is null;
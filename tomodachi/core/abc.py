@@ -18,3 +18,6 @@ class CacheProto(Protocol):
     bot: Tomodachi
     pool: ConnectionPool
     redis: Redis
+
+    async def publish_invalidation(self, channel: str, key: int) -> None:
+        ...
@@ -6,21 +6,33 @@
 
 from __future__ import annotations
 
+import os
+import time
+import heapq
 import asyncio
-from typing import TYPE_CHECKING, Any, Union, Optional, TypedDict, final
-from datetime import datetime
+import logging
+import contextlib
+from typing import TYPE_CHECKING, Any, Dict, List, Tuple, Union, Optional, TypedDict, final
+from datetime import datetime, timezone, timedelta
 
 import attr
 import ujson
+import asyncpg
 
 from tomodachi.utils import helpers
 from tomodachi.core.enums import ActionType
+from tomodachi.utils.wheel import TimingWheel
+from tomodachi.core.journal import ActionJournal
 
 if TYPE_CHECKING:
     from tomodachi.core.bot import Tomodachi
 
 __all__ = ["Action", "ActionScheduler"]
 
+log = logging.getLogger(__name__)
+
+MAX_ACTION_ID = 2**63 - 1
+
 
 class ReminderExtras(TypedDict):
     content: str
@@ -57,61 +69,394 @@ class Action:
     message_id: Optional[int] = None
     extra: Optional[Union[ReminderExtras, InfractionExtras]] = attr.ib(converter=convert_extra, default=None)
 
+    def to_payload(self) -> Dict[str, Any]:
+        return attr.asdict(self, recurse=False)
+
+    @classmethod
+    def from_payload(cls, payload: Dict[str, Any]) -> Action:
+        for name in ("created_at", "trigger_at"):
+            if payload.get(name) is not None:
+                payload[name] = datetime.fromisoformat(payload[name])
+        return cls(**payload)
+
 
 @final
 class ActionScheduler:
+    # actions due within the window are kept in memory, the rest stays in database
+    WINDOW = timedelta(hours=1)
+    BATCH_SIZE = 500
+    # actions due this close to each other are fired together
+    FIRE_TOLERANCE = timedelta(milliseconds=250)
+    FIRE_BATCH_SIZE = 1000
+    # actions that became overdue while the bot was down are drained separately,
+    # with bounded concurrency and a rate that leaves room for the rest of the bot
+    CATCHUP_PAGE_SIZE = 50
+    CATCHUP_CONCURRENCY = 4
+    CATCHUP_RATE = 25.0
+    CATCHUP_RETRY_DELAY = 5.0
+
     def __init__(self, bot: Tomodachi):
         self.bot = bot
-        self.cond = asyncio.Condition()
+        # each process fires only actions of guilds on its own shards,
+        # guild-less ones belong to the process which owns shard 0
+        self.shard_count: int = bot.config.SHARD_COUNT
+        self.shard_ids: List[int] = list(bot.config.SHARD_IDS)
+        self.owns_guildless = 0 in self.shard_ids
+        # min-heap of loaded actions, cancelled entries are skipped lazily
+        self.heap: List[Tuple[datetime, int, Action]] = []
+        self.queued: Dict[int, Action] = {}
+        # every stored action from boot up to this (trigger_at, id) key is loaded in the heap,
+        # everything before boot is left for the catch-up
+        self.booted_at = helpers.utcnow()
+        self.cursor: Tuple[datetime, int] = (self.booted_at, 0)
+        self.exhausted = False
+        # actions stored while the window was being loaded, they might be missed by the query
+        self.refilling = False
+        self.pending: List[Action] = []
+        self.wakeup = asyncio.Event()
+        self.batches_fired = 0
+        self.actions_fired = 0
+        self.setup_metrics()
+        # actions due within a minute never reach database, they wait in the wheel
+        # and are written to a local journal, so they survive restarts
+        self.short_actions: TimingWheel[Tuple[str, Action]] = TimingWheel(self.trigger_short_actions)
+        journal_name = "short_actions-{0}.journal".format("-".join(map(str, self.shard_ids)))
+        self.journal = ActionJournal(os.path.join(bot.ROOT_DIR, journal_name))
+        self.replay_short_actions()
+
+        self.backlog = 0
+        self.backlog_drained = 0
+        self.catchup_started_at: Optional[float] = None
+        self.catchup_finished_at: Optional[float] = None
+        self._next_catchup_slot = 0.0
+        self.failed_pages = 0
+
         self.task = asyncio.create_task(self.dispatcher())
-        self.active: Optional[Action] = None
+        self.catchup_task = asyncio.create_task(self.catch_up(self.booted_at))
+
+    def setup_metrics(self):
+        metrics = self.bot.metrics
+        # how late actions are dispatched compared to their trigger_at
+        self.fire_lag = {
+            source: metrics.histogram("scheduler_fire_lag_seconds", source=source)
+            for source in ("window", "catchup", "short")
+        }
+        self.db_time = {
+            op: metrics.histogram("scheduler_db_seconds", op=op) for op in ("refill", "claim", "catchup_page")
+        }
+        # sampled on every dispatcher cycle
+        self.queue_depth = metrics.histogram("scheduler_queue_depth", bounds=tuple(2**i for i in range(17)))
+        self.wakeups = metrics.counter("scheduler_wakeups_total")
+        self.refills = metrics.counter("scheduler_refills_total")
+        self.restarts = metrics.counter("scheduler_restarts_total")
+
+        metrics.gauge("scheduler_queued_actions", lambda: len(self.queued))
+        metrics.gauge("scheduler_short_actions", lambda: len(self.short_actions))
+        metrics.gauge("scheduler_backlog_remaining", lambda: max(self.backlog - self.backlog_drained, 0))
+
+    async def close(self):
+        self.task.cancel()
+        self.catchup_task.cancel()
+        self.short_actions.close()
+        await self.journal.close()
+
+    def replay_short_actions(self):
+        now = helpers.utcnow()
+        entries = self.journal.replay()
+
+        for key, payload in entries:
+            action = Action.from_payload(payload)
+            self.short_actions.add((action.trigger_at - now).total_seconds(), (key, action))
+
+        if entries:
+            log.info(f"restored {len(entries)} short actions from the journal")
+
+    @property
+    def next_action(self) -> Optional[Action]:
+        while self.heap:
+            _, action_id, action = self.heap[0]
+            if self.queued.get(action_id) is action:
+                return action
+            heapq.heappop(self.heap)
+        return None
 
-    async def dispatcher(self):
-        async with self.cond:
-            action = self.active = await self.get_action()
+    def ownership_filter(self, first_param: int) -> str:
+        # shard count is inlined, the same expression as in the per-shard index
+        return (
+            f"((guild_id >> 22) % {int(self.shard_count)} = ANY(${first_param}::bigint[]) "
+            f"OR (guild_id IS NULL AND ${first_param + 1}))"
+        )
+
+    def owned_page_query(self, bound: str) -> str:
+        """Keyset page of owned actions in (trigger_at, id) order, takes the cursor, the trigger_at bound,
+        the page size, shard IDs and whether guild-less actions are owned.
+
+        Every shard is read by its own scan of the per-shard index, so no scan has to skip the rows
+        of other shards and only the first rows of each are merged."""
+        return f"""SELECT *
+            FROM (
+                SELECT a.*
+                FROM unnest($5::bigint[]) AS s (shard_id)
+                    CROSS JOIN LATERAL (
+                        SELECT *
+                        FROM actions
+                        WHERE (guild_id >> 22) % {int(self.shard_count)} = s.shard_id
+                            AND (trigger_at, id) > ($1, $2) AND trigger_at {bound} $3
+                        ORDER BY trigger_at, id
+                        LIMIT $4
+                    ) a
+                UNION ALL
+                (
+                    SELECT *
+                    FROM actions
+                    WHERE guild_id IS NULL AND $6 AND (trigger_at, id) > ($1, $2) AND trigger_at {bound} $3
+                    ORDER BY trigger_at, id
+                    LIMIT $4
+                )
+            ) owned
+            ORDER BY trigger_at, id
+            LIMIT $4;"""
+
+    async def check_shard_index(self):
+        """Warns when the index of per-shard windows doesn't match the configured shard count"""
+        name = f"actions_shard{int(self.shard_count)}_trigger_at_id_idx"
+        try:
+            async with self.bot.db.pool.acquire() as conn:
+                query = "SELECT EXISTS(SELECT 1 FROM pg_indexes WHERE tablename = 'actions' AND indexname = $1);"
+                exists = await conn.fetchval(query, name)
+        except asyncpg.PostgresError:
+            log.exception("failed to look up the index of per-shard windows")
+            return
+
+        if not exists:
+            log.warning(
+                f"index {name} is missing, refills will scan the whole window. "
+                f"Recreate the per-shard index from sql/schema.sql for SHARD_COUNT = {int(self.shard_count)}"
+            )
 
-            if not action:
-                await self.cond.wait()
-                await self.redispatch()
+    def owns(self, action: Action) -> bool:
+        if action.guild_id is None:
+            return self.owns_guildless
+        return (action.guild_id >> 22) % self.shard_count in self.shard_ids
+
+    def push(self, action: Action):
+        """Adds an action which is already stored in database"""
+        if not self.owns(action):
+            return
+
+        if self.refilling:
+            self.pending.append(action)
+
+        if (action.trigger_at, action.id) > self.cursor or action.id in self.queued:
+            return
+
+        head = self.next_action
+        self.queued[action.id] = action
+        heapq.heappush(self.heap, (action.trigger_at, action.id, action))
+
+        if head is None or action.trigger_at < head.trigger_at:
+            self.wakeup.set()
+
+    def cancel(self, *action_ids: int):
+        """Forgets actions that were deleted from database"""
+        for action_id in action_ids:
+            self.queued.pop(action_id, None)
+
+        # rebuild the heap once most of it is made of cancelled entries
+        if len(self.heap) > 2 * len(self.queued) + 64:
+            self.heap = [entry for entry in self.heap if self.queued.get(entry[1]) is entry[2]]
+            heapq.heapify(self.heap)
+
+    def needs_refill(self, now: datetime) -> bool:
+        if self.exhausted:
+            return self.cursor[0] <= now + self.WINDOW / 2
+        return len(self.queued) < self.BATCH_SIZE // 2
+
+    async def refill(self, now: datetime):
+        horizon = now + self.WINDOW
+
+        self.refilling = True
+        started_at = time.perf_counter()
+        try:
+            async with self.bot.db.pool.acquire() as conn:
+                stmt = await conn.prepare(self.owned_page_query("<="))
+                records = await stmt.fetch(*self.cursor, horizon, self.BATCH_SIZE, self.shard_ids, self.owns_guildless)
+        finally:
+            self.refilling = False
+            self.db_time["refill"].observe(time.perf_counter() - started_at)
+
+        self.refills.inc()
+
+        actions = [Action(**record) for record in records]
+        self.exhausted = len(actions) < self.BATCH_SIZE
+        self.cursor = (horizon, MAX_ACTION_ID) if self.exhausted else (actions[-1].trigger_at, actions[-1].id)
+
+        for action in actions:
+            if action.id not in self.queued:
+                self.queued[action.id] = action
+                heapq.heappush(self.heap, (action.trigger_at, action.id, action))
+
+        pending, self.pending = self.pending, []
+        for action in pending:
+            self.push(action)
+
+    async def sleep_until(self, when: datetime):
+        delay = (when - helpers.utcnow()).total_seconds()
+        if delay <= 0:
+            return
+
+        self.wakeup.clear()
+        with contextlib.suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(self.wakeup.wait(), timeout=delay)
+            # woken up by a push before the deadline
+            self.wakeups.inc()
 
-            now = helpers.utcnow()
-            if action.trigger_at >= now:
-                delta = (action.trigger_at - now).total_seconds()
-                await asyncio.sleep(delta)
+    async def dispatcher(self):
+        await self.check_shard_index()
+
+        while True:
+            try:
+                now = helpers.utcnow()
+                self.queue_depth.observe(len(self.queued))
+                if self.needs_refill(now):
+                    await self.refill(now)
+
+                action = self.next_action
+                if action is None or action.trigger_at > now:
+                    # a partially loaded window is refilled once it drains, a full one when it runs out
+                    deadlines = [action.trigger_at] if action else []
+                    if self.exhausted:
+                        deadlines.append(self.cursor[0] - self.WINDOW / 2)
+
+                    await self.sleep_until(min(deadlines))
+                    continue
+
+                due = self.pop_due(now + self.FIRE_TOLERANCE)
+                try:
+                    await self.trigger_actions(due)
+                except Exception:
+                    # the cursor is already past them, they're only retried if they go back to the window
+                    for action in due:
+                        self.push(action)
+                    raise
+
+            except asyncio.CancelledError:
+                raise
+            except Exception:  # noqa
+                self.restarts.inc()
+                log.exception("action dispatcher failed, retrying in 5 seconds")
+                await asyncio.sleep(5.0)
+
+    @property
+    def drain_rate(self) -> float:
+        """Overdue actions fired per second since the catch-up started"""
+        if self.catchup_started_at is None:
+            return 0.0
+
+        finished_at = self.catchup_finished_at or asyncio.get_running_loop().time()
+        elapsed = finished_at - self.catchup_started_at
+        return self.backlog_drained / elapsed if elapsed > 0 else 0.0
+
+    async def pace(self, count: int):
+        # spreading pages over time, so firing the backlog doesn't exhaust discord rate limits
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        start = max(now, self._next_catchup_slot)
+        self._next_catchup_slot = start + count / self.CATCHUP_RATE
+        await asyncio.sleep(start - now)
+
+    async def catch_up_worker(self, queue: asyncio.Queue):
+        while True:
+            page = await queue.get()
+            try:
+                await self.pace(len(page))
+                self.backlog_drained += await self.trigger_actions(page, source="catchup")
+            except Exception:  # noqa
+                # actions are deleted only when fired, so the next pass picks the page up again
+                self.failed_pages += 1
+                log.exception(f"failed to fire a page of {len(page)} overdue actions, retrying on the next pass")
+            finally:
+                queue.task_done()
+
+    async def fetch_catchup_page(self, cursor: Tuple[datetime, int], until: datetime) -> List[Action]:
+        while True:
+            started_at = time.perf_counter()
+            try:
+                async with self.bot.db.pool.acquire() as conn:
+                    stmt = await conn.prepare(self.owned_page_query("<"))
+                    records = await stmt.fetch(
+                        *cursor, until, self.CATCHUP_PAGE_SIZE, self.shard_ids, self.owns_guildless
+                    )
+            except Exception:  # noqa
+                log.exception(f"failed to fetch a page of overdue actions, retrying in {self.CATCHUP_RETRY_DELAY}s")
+                await asyncio.sleep(self.CATCHUP_RETRY_DELAY)
+                continue
+
+            self.db_time["catchup_page"].observe(time.perf_counter() - started_at)
+            return [Action(**record) for record in records]
+
+    async def catch_up(self, until: datetime):
+        """Fires actions which became overdue before the given time, passes are repeated until none are left.
+
+        The dispatcher window starts at boot, so nothing else would ever fire these."""
+        while True:
+            try:
+                done = await self.catch_up_pass(until)
+            except asyncio.CancelledError:
+                raise
+            except Exception:  # noqa
+                log.exception(f"catch-up of overdue actions failed, retrying in {self.CATCHUP_RETRY_DELAY}s")
+                done = False
+
+            if done:
+                return
+            await asyncio.sleep(self.CATCHUP_RETRY_DELAY)
+
+    async def catch_up_pass(self, until: datetime) -> bool:
+        """Streams overdue actions through a worker pool, returns False if some of them failed to fire"""
+        async with self.bot.db.pool.acquire() as conn:
+            query = f"SELECT count(*) FROM actions WHERE trigger_at < $1 AND {self.ownership_filter(2)};"
+            remaining = await conn.fetchval(query, until, self.shard_ids, self.owns_guildless)
 
-            await self.trigger_action(action)
-            await self.redispatch()
+        if not remaining:
+            return True
 
-    async def redispatch(self):
-        if not self.task.cancelled() or self.task.done():
-            self.task.cancel()
+        self.backlog = self.backlog_drained + remaining
+        log.info(f"catching up on {remaining} overdue actions")
+        if self.catchup_started_at is None:
+            self.catchup_started_at = asyncio.get_running_loop().time()
 
-        self.task = asyncio.create_task(self.dispatcher())
+        # bounded queue keeps the producer only a few pages ahead of the workers
+        queue = asyncio.Queue(maxsize=self.CATCHUP_CONCURRENCY)
+        workers = [asyncio.create_task(self.catch_up_worker(queue)) for _ in range(self.CATCHUP_CONCURRENCY)]
+        cursor = (datetime.min.replace(tzinfo=timezone.utc), 0)
+        self.failed_pages = 0
 
-        async with self.cond:
-            self.cond.notify_all()
+        try:
+            while page := await self.fetch_catchup_page(cursor, until):
+                cursor = (page[-1].trigger_at, page[-1].id)
+                await queue.put(page)
 
-    async def get_action(self):
-        async with self.bot.db.pool.acquire() as conn:
-            query = """SELECT *
-                FROM actions
-                WHERE (CURRENT_TIMESTAMP + '28 days'::interval) > actions.trigger_at
-                ORDER BY actions.trigger_at
-                LIMIT 1;"""
-            stmt = await conn.prepare(query)
-            record = await stmt.fetchrow()
+            await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
 
-        if not record:
-            return None
+        if self.failed_pages:
+            return False
 
-        return Action(**record)
+        self.catchup_finished_at = asyncio.get_running_loop().time()
+        log.info(f"caught up on {self.backlog_drained}/{self.backlog} overdue actions at {self.drain_rate:.1f}/s")
+        return True
 
     async def schedule(self, a: Action):
         now = helpers.utcnow()
         delta = (a.trigger_at - now).total_seconds()
 
         if delta <= 60 and a.action_type is not ActionType.INFRACTION:
-            asyncio.create_task(self.trigger_short_action(delta, a))
+            key = self.journal.new_key()
+            self.journal.add(key, a.to_payload())
+            self.short_actions.add(delta, (key, a))
             return a
 
         async with self.bot.db.pool.acquire() as conn:
@@ -132,23 +477,64 @@ class ActionScheduler:
             )
 
         a = Action(**record)
-        # Once the new action created dispatcher has to be restarted
-        # but only if the currently active action happens later than new
-        if (self.active and self.active.trigger_at >= a.trigger_at) or self.active is None:
-            asyncio.create_task(self.redispatch())
+        # actions beyond the loaded window will be picked up once the window slides
+        self.push(a)
 
         return a
 
-    async def trigger_action(self, action: Action):
-        if action.action_type is ActionType.INFRACTION:
-            infraction = await self.bot.infractions.get_by_action(action.id)
-            self.bot.dispatch("expired_infraction", infraction=infraction)
+    def pop_due(self, until: datetime) -> List[Action]:
+        due = []
+        while len(due) < self.FIRE_BATCH_SIZE and (action := self.next_action) and action.trigger_at <= until:
+            heapq.heappop(self.heap)
+            del self.queued[action.id]
+            due.append(action)
+        return due
 
-        else:
-            self.bot.dispatch("triggered_action", action=action)
+    async def trigger_actions(self, actions: List[Action], *, source: str = "window"):
+        started_at = time.perf_counter()
+
+        # infractions lose their action_id once actions are deleted, so they're fetched first
+        infraction_action_ids = [a.id for a in actions if a.action_type is ActionType.INFRACTION]
+        infractions = {}
+        if infraction_action_ids:
+            infractions = await self.bot.infractions.get_by_actions(infraction_action_ids)
+
+        async with self.bot.db.pool.acquire() as conn:
+            query = "DELETE FROM actions WHERE id = ANY($1::bigint[]) RETURNING id;"
+            records = await conn.fetch(query, [a.id for a in actions])
+
+        self.db_time["claim"].observe(time.perf_counter() - started_at)
+
+        # actions deleted by someone else in the meantime are not fired
+        claimed = {r["id"] for r in records}
+        lag = self.fire_lag[source]
+        now = helpers.utcnow()
+        fired = 0
+
+        for action in actions:
+            if action.id not in claimed:
+                continue
 
-        await self.bot.db.pool.execute("DELETE FROM actions WHERE id = $1;", action.id)
+            if action.action_type is ActionType.INFRACTION:
+                self.bot.dispatch("expired_infraction", infraction=infractions.get(action.id))
+            else:
+                self.bot.dispatch("triggered_action", action=action)
+
+            lag.observe((now - action.trigger_at).total_seconds())
+            fired += 1
+
+        self.batches_fired += 1
+        self.actions_fired += fired
+        log.debug(f"fired a batch of {fired} actions")
+
+        return fired
+
+    def trigger_short_actions(self, entries: List[Tuple[str, Action]]):
+        lag = self.fire_lag["short"]
+        now = helpers.utcnow()
+
+        for _, action in entries:
+            self.bot.dispatch("triggered_action", action=action)
+            lag.observe((now - action.trigger_at).total_seconds())
 
-    async def trigger_short_action(self, seconds, action: Action):
-        await asyncio.sleep(seconds)
-        self.bot.dispatch("triggered_action", action=action)
+        self.journal.complete(key for key, _ in entries)
@@ -0,0 +1,105 @@
+#  Copyright (c) 2020 — present, Kirill M.
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import time
+import heapq
+from typing import TYPE_CHECKING, Set, Dict, List, Tuple, Union
+
+import orjson
+from asyncpg.exceptions import UniqueViolationError
+
+if TYPE_CHECKING:
+    from tomodachi.core.bot import Tomodachi
+
+__all__ = ["Blacklist"]
+
+
+class Blacklist:
+    """Users who can't use the bot, either permanently or for a while.
+
+    Permanent entries mirror the ``blacklisted`` table and are updated one by one,
+    temporary blocks live in memory only and expire lazily, without a task per user."""
+
+    def __init__(self, bot: Tomodachi) -> None:
+        self.bot = bot
+        self.permanent: Set[int] = set()
+        # user id -> monotonic time of unblocking
+        self.temporary: Dict[int, float] = {}
+        # min-heap of (unblock time, user id), might contain entries which were overridden
+        self._expiry: List[Tuple[float, int]] = []
+
+    def __contains__(self, user_id: int) -> bool:
+        if user_id in self.permanent:
+            return True
+
+        if not self.temporary:
+            return False
+
+        now = time.monotonic()
+        if self._expiry[0][0] <= now:
+            self.evict(now)
+
+        return user_id in self.temporary
+
+    def __len__(self) -> int:
+        return len(self.permanent)
+
+    def evict(self, now: float):
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, user_id = heapq.heappop(self._expiry)
+            # the user might have been blocked again since then
+            if self.temporary.get(user_id) == expires_at:
+                del self.temporary[user_id]
+
+    def block(self, user_id: int, delay: Union[float, int]):
+        """Temporary blocks a user by their ID, an existing block is only ever extended"""
+        if user_id in self.permanent:
+            return
+
+        # concurrent messages of one user may all get here before the first block is in place
+        expires_at = time.monotonic() + delay
+        if self.temporary.get(user_id, 0.0) >= expires_at:
+            return
+
+        self.temporary[user_id] = expires_at
+        heapq.heappush(self._expiry, (expires_at, user_id))
+
+    async def load(self):
+        async with self.bot.db.pool.acquire() as conn:
+            records = await conn.fetch("SELECT DISTINCT user_id FROM blacklisted;")
+
+        self.permanent = {r["user_id"] for r in records}
+
+    async def add(self, user_id: int, reason: str) -> bool:
+        """Permanently blacklists a user, returns False if they already were blacklisted"""
+        async with self.bot.db.pool.acquire() as conn:
+            query = "INSERT INTO blacklisted (user_id, reason) VALUES ($1, $2);"
+            try:
+                await conn.execute(query, user_id, reason)
+            except UniqueViolationError:
+                return False
+
+        self.permanent.add(user_id)
+        return True
+
+    async def remove(self, user_id: int) -> bool:
+        """Removes a user from the permanent blacklist, returns False if they weren't there"""
+        async with self.bot.db.pool.acquire() as conn:
+            query = "DELETE FROM blacklisted WHERE user_id = $1 RETURNING true;"
+            value = await conn.fetchval(query, user_id)
+
+        self.permanent.discard(user_id)
+        return bool(value)
+
+    async def handle_notification(self, payload: str):
+        # changes made by other processes
+        data = orjson.loads(payload)
+
+        if data["op"] == "add":
+            self.permanent.add(data["user_id"])
+        elif data["op"] == "remove":
+            self.permanent.discard(data["user_id"])
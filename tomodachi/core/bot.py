@@ -5,10 +5,8 @@
 
 from __future__ import annotations
 
-import asyncio
 import logging
 from typing import Union
-from contextlib import suppress
 
 import aiohttp
 import discord
@@ -16,11 +14,19 @@ from discord.ext import commands
 
 import config
 import tomodachi.utils.database.instance
+from tomodachi.core import tracing
 from tomodachi.utils import AniList, i, make_intents
 from tomodachi.core.cache import Cache
 from tomodachi.core.actions import ActionScheduler
 from tomodachi.core.context import TomodachiContext
-from tomodachi.core.exceptions import AlreadyBlacklisted
+from tomodachi.core.metrics import Metrics, MetricsServer
+from tomodachi.core.tracing import Trace, Tracer
+from tomodachi.core.prefixes import PrefixIndex
+from tomodachi.core.resolver import EntityResolver
+from tomodachi.core.blacklist import Blacklist
+from tomodachi.core.cooldowns import CooldownStore
+from tomodachi.core.ratelimit import RateLimiter
+from tomodachi.core.modactions import OwnModActions
 from tomodachi.core.infractions import Infractions
 
 __all__ = ["Tomodachi"]
@@ -35,6 +41,8 @@ class Tomodachi(commands.AutoShardedBot):
             command_prefix=self.get_prefix,
             intents=make_intents(),
             owner_ids=config.OWNER_IDS,
+            shard_ids=config.SHARD_IDS,
+            shard_count=config.SHARD_COUNT,
         )
         self._BotBase__cogs = commands.core._CaseInsensitiveDict()  # noqa
 
@@ -42,17 +50,36 @@ class Tomodachi(commands.AutoShardedBot):
         self.ROOT_DIR = root_dir
         self.config = config
 
+        # In-memory histograms and counters, optionally served to prometheus
+        self.metrics = Metrics()
+        # per-command timings of every stage of handling a message
+        self.tracer = Tracer(self.metrics)
+        self.trace_http()
+        self.trace_body()
+        self.metrics_server = None
+        if config.METRICS_PORT:
+            self.metrics_server = MetricsServer(self.metrics, host=config.METRICS_HOST, port=config.METRICS_PORT)
+
         # Database related
         self.cache = Cache(self)
         self.actions = ActionScheduler(self)
         self.infractions = Infractions(self)
-        # list with user ids
-        self.blacklist = []
+        # REST fallback for entities missing from the gateway cache
+        self.resolver = EntityResolver(self)
+        # bans and unbans in progress, their gateway events don't need an audit log lookup
+        self.own_mod_actions = OwnModActions()
+        # permanently blacklisted and temporarily blocked users
+        self.blacklist = Blacklist(self)
+        # prefixes in use, allows to skip messages which can't be commands
+        self.prefixes = PrefixIndex(config.DEFAULT_PREFIX)
+        self.metrics.gauge("prefix_rejection_rate", lambda: self.prefixes.rejection_rate)
 
         self.logger = discord.Webhook.from_url(config.LOGGER_HOOK, session=session)
 
-        # Global rate limit cooldowns mapping
-        self.rate_limits = commands.CooldownMapping.from_cooldown(10, 10, commands.BucketType.user)
+        # Global rate limit, shared by all processes
+        self.rate_limits = RateLimiter(self, rate=10, per=10.0)
+        # Command cooldowns of cogs, shared by all processes
+        self.cooldowns = CooldownStore(self)
 
         # After init tasks
         self.loop.create_task(self.__ainit__())
@@ -61,10 +88,23 @@ class Tomodachi(commands.AutoShardedBot):
 
     async def __ainit__(self):
         await AniList.setup(self.session)
-        await self.fetch_blacklist()
+        await self.blacklist.load()
+
+        await self.db.listen("settings", self.cache.settings.on_notification)
+        await self.db.listen("blacklist", self.blacklist.handle_notification)
+        self.db.on_resync(self.resync)
+
+        if self.metrics_server:
+            try:
+                await self.metrics_server.start()
+            except OSError:
+                # e.g. another process on this host already serves its metrics on the port
+                logging.exception("failed to start the metrics server")
 
     async def close(self):
-        self.actions.task.cancel()
+        await self.actions.close()
+        if self.metrics_server:
+            await self.metrics_server.close()
 
         if not self.session.closed:
             await self.session.close()
@@ -73,18 +113,33 @@ class Tomodachi(commands.AutoShardedBot):
         await self.cache.close()
         await super().close()
 
+    async def resync(self):
+        """Reloads everything kept coherent by database notifications, some of them might have been missed"""
+        self.cache.settings.clear_local()
+        self.prefixes.clear()
+
+        warmed = await self.cache.settings.warm([guild.id for guild in self.guilds])
+        for settings in warmed:
+            self.prefixes.set(settings.guild_id, settings.prefix)
+
+        await self.blacklist.load()
+        logging.info(f"resynced settings of {len(warmed)} guilds and the blacklist")
+
     @property
     def support_guild(self):
         return self.get_guild(config.SUPPORT_GUILD_ID)
 
     async def get_prefix(self, message: discord.Message):
-        settings = await self.cache.settings.get(message.guild.id)
+        with tracing.stage("get_prefix"):
+            settings = await self.cache.settings.get(message.guild.id)
         prefix = settings.prefix or config.DEFAULT_PREFIX
+        self.prefixes.set(message.guild.id, prefix)
         return [f"<@!{self.user.id}> ", f"<@{self.user.id}> ", prefix]
 
     async def update_prefix(self, guild_id: int, new_prefix: str):
-        async with self.cache.settings.fresh(guild_id):
-            prefix = await self.db.update_prefix(guild_id, new_prefix)
+        prefix = await self.db.update_prefix(guild_id, new_prefix)
+        await self.cache.settings.update(guild_id, prefix=prefix)
+        self.prefixes.set(guild_id, prefix)
         return prefix
 
     async def get_context(self, message, *, cls=None) -> Union[TomodachiContext, commands.Context]:
@@ -94,15 +149,30 @@ class Tomodachi(commands.AutoShardedBot):
         if message.author.bot:
             return
 
-        if message.author.id in self.blacklist:
-            return
+        trace = self.tracer.start()
+        try:
+            with trace.stage("total"):
+                await self.process_traced(message, trace)
+        finally:
+            self.tracer.finish(trace)
+
+    async def process_traced(self, message: discord.Message, trace: Trace):
+        with trace.stage("blacklist"):
+            if message.author.id in self.blacklist:
+                return
+
+        with trace.stage("prefix_index"):
+            if not self.prefixes.may_be_command(message):
+                return
 
-        ctx = await self.get_context(message)
+        with trace.stage("get_context"):
+            ctx = await self.get_context(message)
         if ctx.command is None:
             return
 
-        bucket = self.rate_limits.get_bucket(ctx.message)
-        retry_after = bucket.update_rate_limit()
+        trace.command = ctx.command.qualified_name
+        with trace.stage("rate_limit"):
+            retry_after = await self.rate_limits.hit(ctx.message)
 
         if retry_after:
             # not being detected by the global error handler
@@ -111,28 +181,34 @@ class Tomodachi(commands.AutoShardedBot):
 
             # in order to prevent spamming from the bot, we block
             # the user until they are able to use commands again
-            asyncio.create_task(self.temp_block(ctx.author.id, retry_after))
+            self.blacklist.block(ctx.author.id, retry_after)
             return await ctx.reply(f"You are being rate limited for `{retry_after:.2f}` seconds.")
 
-        await self.invoke(ctx)
+        # includes checks, argument conversion and the body, which is also timed on its own
+        with trace.stage("invoke"):
+            await self.invoke(ctx)
 
-    async def temp_block(self, user_id: int, delay: Union[float, int]):
-        """Temporary adds a user by their ID to the bot's blacklist"""
-        if user_id in self.blacklist:
-            raise AlreadyBlacklisted(f"{user_id} is already blacklisted, failed to blacklist them temporarily.")
+    def trace_http(self):
+        request = self.http.request
 
-        self.blacklist.append(user_id)
-        if delay:
-            await asyncio.sleep(delay)
+        async def traced_request(*args, **kwargs):
+            with tracing.stage("http"):
+                return await request(*args, **kwargs)
 
-        with suppress(ValueError):
-            self.blacklist.remove(user_id)
+        self.http.request = traced_request
 
-    async def fetch_blacklist(self):
-        async with self.db.pool.acquire() as conn:
-            records = await conn.fetch("SELECT DISTINCT * FROM blacklisted;")
+    def trace_body(self):
+        # the global before hook runs once checks, cooldowns and argument conversion are done, right before the callback
+        async def start_body(ctx: TomodachiContext):
+            ctx.body_stage = tracing.stage("body").start()
 
-        self.blacklist = [r["user_id"] for r in records]
+        async def stop_body(ctx: TomodachiContext):
+            if ctx.body_stage is not None:
+                ctx.body_stage.stop()
+                ctx.body_stage = None
+
+        self.before_invoke(start_body)
+        self.after_invoke(stop_body)
 
     async def load_extensions(self):
         await self.wait_until_ready()
@@ -143,21 +219,27 @@ class Tomodachi(commands.AutoShardedBot):
 
     async def once_ready(self):
         await self.wait_until_ready()
+        self.prefixes.set_user(self.user.id)
+
+        guild_ids = [guild.id for guild in self.guilds]
+        await self.db.store_guilds(guild_ids)
+        warmed = await self.cache.settings.warm(guild_ids)
+        for settings in warmed:
+            self.prefixes.set(settings.guild_id, settings.prefix)
 
-        for guild in self.guilds:
-            self.loop.create_task(self.db.store_guild(guild.id))
+        logging.info(f"warmed up settings of {len(warmed)} guilds")
 
         emojis = await self.support_guild.fetch_emojis()
         await i.setup(emojis)
 
     async def get_or_fetch_user(self, user_id: int) -> discord.User:
         """Retrives a discord.User object from cache or fetches it if not cached"""
-        return self.get_user(user_id) or (await self.fetch_user(user_id))
+        return await self.resolver.user(user_id)
 
     async def get_or_fetch_member(self, guild: discord.Guild, user_id: int):
         """Retrives a discord.Member oject from cache or fetches it if not cached"""
-        return guild.get_member(user_id) or (await guild.fetch_member(user_id))
+        return await self.resolver.member(guild, user_id)
 
     async def get_or_fetch_guild(self, guild_id: int) -> discord.Guild:
         """Retrives a discord.Guild oject from cache or fetches it if not cached"""
-        return self.get_guild(guild_id) or (await self.fetch_guild(guild_id))
+        return await self.resolver.guild(guild_id)
@@ -5,62 +5,175 @@
 
 from __future__ import annotations
 
-from typing import TYPE_CHECKING
-from contextlib import asynccontextmanager
+import uuid
+import random
+import asyncio
+import logging
+from typing import TYPE_CHECKING, Any, Dict, Mapping, Optional, Sequence
 
+import attr
 import orjson
 import aioredis
 
 from tomodachi.core.abc import CacheProto
+from tomodachi.utils.lru import LRUCache
 from tomodachi.core.models import Settings
 from tomodachi.core.exceptions import CacheFail, CacheMiss
+from tomodachi.utils.singleflight import SingleFlight
 
 if TYPE_CHECKING:
     from tomodachi.core.bot import Tomodachi
 
+log = logging.getLogger(__name__)
+
+SETTINGS_FIELDS = tuple(a.name for a in attr.fields(Settings))
+
+# patches fields of a cached hash, but never creates a partial one
+PATCH_HASH_SCRIPT = """
+if redis.call("exists", KEYS[1]) == 1 then
+    redis.call("hset", KEYS[1], unpack(ARGV))
+    return 1
+end
+return 0
+"""
+
 
 class CachedSettings:
+    # redis channel used to tell other processes to drop their local copies
+    INVALIDATION_CHANNEL = "tomodachi:settings:invalidate"
+    # database triggers keep entries coherent, so they may live long
+    TTL = 604800
+    TTL_JITTER = 86400
+
+    SELECT_QUERY = """select
+        g.guild_id,
+        g.prefix,
+        g.lang,
+        ms.mute_role,
+        ms.mod_roles,
+        ms.audit_infractions,
+        ms.dm_targets
+    from guilds g
+        left join mod_settings ms on g.guild_id = ms.guild_id"""
+
     def __init__(self, /, parent: CacheProto) -> None:
         self._parent = parent
+        # ready-made Settings objects, so the hot path doesn't touch redis
+        self._local: LRUCache[int, Settings] = LRUCache(maxsize=10_000, ttl=1800.0)
+        # refreshes caused by cache misses, only one per guild at a time
+        self._refreshes: SingleFlight[int, Settings] = SingleFlight()
+        self._patch_hash = parent.redis.register_script(PATCH_HASH_SCRIPT)
 
-    @asynccontextmanager
-    async def fresh(self, /, guild_id: int):
-        try:
-            yield None
-        finally:
-            await self.refresh(guild_id)
+    @staticmethod
+    def make_key(guild_id: int) -> str:
+        return f"MSH-{guild_id}"
+
+    @staticmethod
+    def dump_fields(fields: Mapping[str, Any]) -> Dict[str, bytes]:
+        return {name: orjson.dumps(value) for name, value in fields.items()}
+
+    @staticmethod
+    def load_fields(data: Mapping[str, str]) -> Dict[str, Any]:
+        return {name: orjson.loads(value) for name, value in data.items()}
+
+    def make_ttl(self) -> int:
+        # spreading expiration so keys written together don't expire together
+        return self.TTL + random.randint(0, self.TTL_JITTER)
 
     async def refresh(self, /, guild_id: int):
         async with self._parent.bot.db.pool.acquire() as conn:
-            query = """select
-                g.guild_id,
-                g.prefix,
-                g.lang,
-                ms.mute_role,
-                ms.mod_roles,
-                ms.audit_infractions,
-                ms.dm_targets
-            from guilds g
-                left join mod_settings ms on g.guild_id = ms.guild_id
-            where g.guild_id = $1;"""
+            query = f"{self.SELECT_QUERY} where g.guild_id = $1;"
             record = await conn.fetchrow(query, guild_id)
 
         if not record:
             raise CacheFail(f"{guild_id} doesn't exist in the mod_settings table.")
 
-        dump = orjson.dumps(dict(record))
-        await self._parent.redis.setex(f"MS-{guild_id}", 43200, dump)
+        key = self.make_key(guild_id)
+        async with self._parent.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(key, mapping=self.dump_fields(record))
+            pipe.expire(key, self.make_ttl())
+            await pipe.execute()
+
+        settings = Settings(**record)
+        self._local.set(guild_id, settings)
+        await self._parent.publish_invalidation(self.INVALIDATION_CHANNEL, guild_id)
+
+        return settings
+
+    async def patch(self, /, guild_id: int, **fields: Any):
+        args = [item for pair in self.dump_fields(fields).items() for item in pair]
+        await self._patch_hash(keys=[self.make_key(guild_id)], args=args)
+
+        if (settings := self._local.get(guild_id)) is not None:
+            self._local.set(guild_id, attr.evolve(settings, **fields))
+
+    async def update(self, /, guild_id: int, **fields: Any):
+        """Writes only changed fields through to the cache, the values must come from the database"""
+        await self.patch(guild_id, **fields)
+        await self._parent.publish_invalidation(self.INVALIDATION_CHANNEL, guild_id)
+
+    async def invalidate(self, /, guild_id: int):
+        await self._parent.redis.delete(self.make_key(guild_id))
+        self.invalidate_local(guild_id)
+
+    async def on_notification(self, payload: str):
+        """Applies a row change announced by the database triggers"""
+        data = orjson.loads(payload)
+        guild_id = data["guild_id"]
+        fields = {name: data[name] for name in SETTINGS_FIELDS if name in data and name != "guild_id"}
+
+        # each process receives the notification itself, so nothing is published
+        if not fields:
+            await self.invalidate(guild_id)
+        else:
+            await self.patch(guild_id, **fields)
+
+        if not fields:
+            self._parent.bot.prefixes.discard(guild_id)
+        elif "prefix" in fields:
+            self._parent.bot.prefixes.set(guild_id, fields["prefix"])
+
+    async def warm(self, /, guild_ids: Sequence[int]):
+        """Loads settings of many guilds at once, costs one query and one redis pipeline"""
+        async with self._parent.bot.db.pool.acquire() as conn:
+            query = f"{self.SELECT_QUERY} where g.guild_id = any($1::bigint[]);"
+            records = await conn.fetch(query, list(guild_ids))
+
+        warmed = []
+        async with self._parent.redis.pipeline(transaction=False) as pipe:
+            for record in records:
+                key = self.make_key(record["guild_id"])
+                pipe.hset(key, mapping=self.dump_fields(record))
+                pipe.expire(key, self.make_ttl())
+
+                settings = Settings(**record)
+                self._local.set(settings.guild_id, settings)
+                warmed.append(settings)
+
+            await pipe.execute()
+
+        return warmed
 
     async def get(self, /, guild_id: int, refresh: bool = True):
-        data = await self._parent.redis.get(f"MS-{guild_id}")
+        if (settings := self._local.get(guild_id)) is not None:
+            return settings
+
+        data = await self._parent.redis.hgetall(self.make_key(guild_id))
         if not data:
             if not refresh:
                 raise CacheMiss(f"There's no cached mod_settings for {guild_id}")
 
-            await self.refresh(guild_id)
-            data = await self._parent.redis.get(f"MS-{guild_id}")
+            return await self._refreshes.run(guild_id, lambda: self.refresh(guild_id))
 
-        return Settings(**orjson.loads(data))
+        settings = Settings(**self.load_fields(data))
+        self._local.set(guild_id, settings)
+        return settings
+
+    def invalidate_local(self, /, guild_id: int):
+        self._local.pop(guild_id)
+
+    def clear_local(self):
+        self._local.clear()
 
 
 class Cache(CacheProto):
@@ -70,10 +183,44 @@ class Cache(CacheProto):
         self.redis = aioredis.Redis(connection_pool=self.pool)
         self.settings = CachedSettings(self)
 
-    async def refresh_by_guild(self, /, guild_id: int):
-        await self.settings.refresh(guild_id)
+        # every process gets its own identifier to ignore its own invalidations
+        self.node_id = uuid.uuid4().hex
+        self.listener: Optional[asyncio.Task] = asyncio.create_task(self.listen_invalidations())
+
+    async def publish_invalidation(self, channel: str, key: int):
+        await self.redis.publish(channel, f"{self.node_id}:{key}")
+
+    async def listen_invalidations(self):
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(CachedSettings.INVALIDATION_CHANNEL)
+
+        try:
+            while True:
+                try:
+                    message = await pubsub.get_message(timeout=1.0)
+                except aioredis.ConnectionError:
+                    log.warning("lost connection to settings invalidation channel, retrying in 5 seconds")
+                    await asyncio.sleep(5.0)
+                    continue
+
+                if not message:
+                    continue
+
+                node_id, _, key = message["data"].partition(":")
+                if node_id == self.node_id:
+                    continue
+
+                if message["channel"] == CachedSettings.INVALIDATION_CHANNEL:
+                    self.settings.invalidate_local(int(key))
+                    self.bot.prefixes.discard(int(key))
+        finally:
+            await pubsub.close()
 
     async def close(self):
+        if self.listener is not None:
+            self.listener.cancel()
+            self.listener = None
+
         await self.redis.close()
         await self.pool.disconnect(inuse_connections=True)
         self.settings = None
@@ -10,6 +10,8 @@ from typing import TYPE_CHECKING
 import discord
 from discord.ext import commands
 
+from tomodachi.core import tracing
+
 if TYPE_CHECKING:
     from tomodachi.core.context import TomodachiContext
 
@@ -33,20 +35,22 @@ def is_manager():
 
 def is_mod():
     async def predicate(ctx: TomodachiContext):
-        settings = await ctx.bot.cache.settings.get(ctx.guild.id)
-        author_roles = [r.id for r in ctx.author.roles]
+        with tracing.stage("check:is_mod"):
+            settings = await ctx.bot.cache.settings.get(ctx.guild.id)
+            author_roles = [r.id for r in ctx.author.roles]
 
-        return any(r_id in author_roles for r_id in settings.mod_roles)
+            return any(r_id in author_roles for r_id in settings.mod_roles)
 
     return commands.check(predicate)
 
 
 def reminders_limit():
     async def predicate(ctx: TomodachiContext):
-        async with ctx.bot.db.pool.acquire() as conn:
-            query = "SELECT count(id) FROM actions WHERE author_id = $1 AND action_type = 'REMINDER';"
-            stmt = await conn.prepare(query)
-            count = await stmt.fetchval(ctx.author.id)
+        with tracing.stage("check:reminders_limit"):
+            async with ctx.bot.db.pool.acquire() as conn:
+                query = "SELECT count(id) FROM actions WHERE author_id = $1 AND action_type = 'REMINDER';"
+                stmt = await conn.prepare(query)
+                count = await stmt.fetchval(ctx.author.id)
 
         if count >= 250:
             raise commands.CheckFailure("Reached the limit of 250 reminders.")
@@ -6,7 +6,7 @@
 from __future__ import annotations
 
 import functools
-from typing import TYPE_CHECKING, Union, Optional
+from typing import TYPE_CHECKING, Dict, Union, Optional
 
 import discord
 from discord.ext import commands
@@ -28,6 +28,23 @@ class CogMixin(commands.Cog, metaclass=commands.CogMeta):
     def __init__(self, /, tomodachi):
         self.bot: Tomodachi = tomodachi
 
+        # cooldowns are moved to the bot's shared store, local buckets are only kept as a fallback
+        self._cooldowns: Dict[str, commands.CooldownMapping] = {}
+        for command in self.walk_commands():
+            if command._buckets.valid:  # noqa
+                self._cooldowns[command.qualified_name] = command._buckets  # noqa
+                command._buckets = commands.CooldownMapping(None, command._buckets.type)  # noqa
+
+    def get_cooldown(self, command: commands.Command) -> Optional[commands.Cooldown]:
+        """Cooldown the command was declared with, its own buckets are disabled once it's moved to the store"""
+        if (mapping := self._cooldowns.get(command.qualified_name)) is not None:
+            return mapping._cooldown  # noqa
+        return command._buckets._cooldown  # noqa
+
+    async def cog_before_invoke(self, ctx: commands.Context):
+        if (mapping := self._cooldowns.get(ctx.command.qualified_name)) is not None:
+            await self.bot.cooldowns.hit(ctx, mapping)
+
     @functools.cached_property
     def formatted_name(self):
         if self.icon is not None:
@@ -16,6 +16,7 @@ if TYPE_CHECKING:
 
     from tomodachi.core.bot import Tomodachi
     from tomodachi.core.menus import MenuEntries
+    from tomodachi.core.tracing import Stage
 
 __all__ = ["TomodachiContext"]
 
@@ -29,6 +30,8 @@ class TomodachiContext(commands.Context):
 
     def __init__(self, **attrs):
         super().__init__(**attrs)
+        # timing of the command callback, started and stopped by the global invoke hooks
+        self.body_stage: Optional[Stage] = None
 
     @staticmethod
     def new_menu(entries: MenuEntries, *, title: Optional[str] = ""):
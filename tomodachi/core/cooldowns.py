@@ -0,0 +1,82 @@
+#  Copyright (c) 2020 — present, Kirill M.
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import time
+import logging
+from typing import TYPE_CHECKING, Union, Optional
+
+import aioredis
+from discord.ext import commands
+
+from tomodachi.utils.lru import LRUCache
+
+if TYPE_CHECKING:
+    from tomodachi.core.bot import Tomodachi
+    from tomodachi.core.context import TomodachiContext
+
+__all__ = ["CooldownStore"]
+
+log = logging.getLogger(__name__)
+
+
+class CooldownStore:
+    """Command cooldowns kept in redis, shared by every process and surviving restarts.
+
+    Every bucket is a counter which expires once its cooldown period is over."""
+
+    KEY_PREFIX = "tomodachi:cooldown"
+    MAX_LOCAL_ENTRIES = 10_000
+
+    def __init__(self, bot: Tomodachi) -> None:
+        self.bot = bot
+        # buckets known to be on cooldown, mapped to the monotonic time they're available again
+        self._blocked: LRUCache[str, float] = LRUCache(self.MAX_LOCAL_ENTRIES)
+        self.redis_down = False
+
+    def make_key(self, ctx: Union[TomodachiContext, commands.Context], mapping: commands.CooldownMapping) -> str:
+        return f"{self.KEY_PREFIX}:{ctx.command.qualified_name}:{mapping._bucket_key(ctx.message)}"  # noqa
+
+    async def hit(self, ctx: Union[TomodachiContext, commands.Context], mapping: commands.CooldownMapping):
+        """Uses the cooldown of the invoked command, raises CommandOnCooldown if it's exhausted"""
+        cooldown: commands.Cooldown = mapping._cooldown  # noqa
+        key = self.make_key(ctx, mapping)
+
+        # repeated attempts during a cooldown don't need to ask redis
+        if (available_at := self._blocked.get(key)) is not None:
+            retry_after = available_at - time.monotonic()
+            if retry_after > 0:
+                raise commands.CommandOnCooldown(cooldown, retry_after, mapping.type)
+
+        retry_after = await self.update(key, ctx, mapping)
+        if retry_after:
+            raise commands.CommandOnCooldown(cooldown, retry_after, mapping.type)
+
+    async def update(
+        self, key: str, ctx: Union[TomodachiContext, commands.Context], mapping: commands.CooldownMapping
+    ) -> Optional[float]:
+        cooldown: commands.Cooldown = mapping._cooldown  # noqa
+
+        try:
+            async with self.bot.cache.redis.pipeline(transaction=True) as pipe:
+                pipe.set(key, 0, nx=True, px=int(cooldown.per * 1000))
+                pipe.incr(key)
+                pipe.pttl(key)
+                _, uses, ttl = await pipe.execute()
+        except (aioredis.ConnectionError, aioredis.TimeoutError):
+            if not self.redis_down:
+                log.warning("redis is unreachable or not responding, falling back to local cooldowns")
+                self.redis_down = True
+
+            return mapping.get_bucket(ctx.message).update_rate_limit()
+
+        self.redis_down = False
+        if uses <= cooldown.rate:
+            return None
+
+        retry_after = ttl / 1000
+        self._blocked.set(key, time.monotonic() + retry_after, ttl=retry_after)
+        return retry_after
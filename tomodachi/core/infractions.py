@@ -7,7 +7,8 @@
 
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Any, Optional
+import itertools
+from typing import TYPE_CHECKING, Any, Dict, List, Tuple, Optional
 from datetime import datetime
 
 import attr
@@ -40,6 +41,36 @@ class Infraction:
     reason: Optional[str] = None
 
 
+@attr.s(slots=True, auto_attribs=True)
+class InfractionSummary:
+    guild_id: int
+    user_id: int
+    # infractions the user received, by type
+    received: Dict[InfractionType, int] = attr.ib(factory=dict)
+    # infractions the user issued as a moderator
+    issued: int = 0
+
+    @property
+    def total(self) -> int:
+        return sum(self.received.values())
+
+
+def make_search_query(filters: Tuple[str, ...]) -> str:
+    conditions = ["guild_id = $1"]
+    for position, name in enumerate(filters, start=2):
+        conditions.append(f"id < ${position}" if name == "before" else f"{name} = ${position}")
+
+    return f"SELECT * FROM infractions WHERE {' AND '.join(conditions)} ORDER BY id DESC LIMIT ${len(filters) + 2};"
+
+
+# one fixed query text for every combination of filters, asyncpg prepares each of them once per connection
+SEARCH_QUERIES: Dict[Tuple[str, ...], str] = {
+    filters: make_search_query(filters)
+    for count in range(5)
+    for filters in itertools.combinations(("id", "target_id", "mod_id", "before"), count)
+}
+
+
 class Infractions:
     def __init__(self, bot: Tomodachi) -> None:
         self.bot = bot
@@ -54,13 +85,50 @@ class Infractions:
             return None
         return Infraction(**record)
 
+    async def get_by_actions(self, ids: List[int]) -> Dict[int, Infraction]:
+        """Get infractions of many actions at once, mapped by action ID"""
+        async with self.bot.db.pool.acquire() as conn:
+            query = "SELECT * FROM infractions WHERE action_id = ANY($1::bigint[]);"
+            records = await conn.fetch(query, ids)
+
+        return {record["action_id"]: Infraction(**record) for record in records}
+
     async def get(self, guild_id: int, *, inf_id: int = None, target_id: int = None, mod_id: int = None):
+        return await self.search(guild_id, inf_id=inf_id, target_id=target_id, mod_id=mod_id, limit=500)
+
+    async def summary(self, guild_id: int, user_id: int) -> InfractionSummary:
+        """Reads precomputed infraction counters of a user, no matter how long their history is"""
         async with self.bot.db.pool.acquire() as conn:
-            query = "select * from get_infractions($1, $2, $3, $4);"
-            records = await conn.fetch(query, guild_id, inf_id, target_id, mod_id)
+            query = "SELECT inf_type, count FROM infraction_counts WHERE guild_id = $1 AND target_id = $2;"
+            records = await conn.fetch(query, guild_id, user_id)
 
-        if not records:
-            return []
+            query = "SELECT count FROM moderator_counts WHERE guild_id = $1 AND mod_id = $2;"
+            issued = await conn.fetchval(query, guild_id, user_id)
+
+        return InfractionSummary(
+            guild_id=guild_id,
+            user_id=user_id,
+            received={InfractionType(r["inf_type"]): r["count"] for r in records if r["count"] > 0},
+            issued=issued or 0,
+        )
+
+    async def search(
+        self,
+        guild_id: int,
+        *,
+        inf_id: int = None,
+        target_id: int = None,
+        mod_id: int = None,
+        before: int = None,
+        limit: int = 10,
+    ) -> List[Infraction]:
+        """Fetches one page of infractions, newest first. Pass the ID of the last seen infraction as ``before``."""
+        filters = {"id": inf_id, "target_id": target_id, "mod_id": mod_id, "before": before}
+        used = tuple(name for name, value in filters.items() if value is not None)
+        query = SEARCH_QUERIES[used]
+
+        async with self.bot.db.pool.acquire() as conn:
+            records = await conn.fetch(query, guild_id, *(filters[name] for name in used), limit)
 
         return [Infraction(**record) for record in records]
 
@@ -86,34 +154,68 @@ class Infractions:
             target_id=target_id,
             reason=reason,
         )
-        # action_type, trigger_at, author_id, guild_id, channel_id, message_id, extra - are required fields
-        # but since it's an infraction we can ignore channel and message ids because it is not a reminder
-        action = Action(
-            action_type=ActionType.INFRACTION,
-            trigger_at=infraction.expires_at,
-            guild_id=infraction.guild_id,
-        )
-
-        if create_action:
-            # override prepared action object with the one from db
-            action = await self.bot.actions.schedule(action)
-
+        # both rows are written by one statement, so an infraction never ends up without its action
         async with self.bot.db.pool.acquire() as conn:
-            query = """INSERT INTO infractions
-            (action_id, inf_type, created_at, expires_at, guild_id, mod_id, target_id, reason)
-            VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+            query = """WITH new_action AS (
+                INSERT INTO actions (action_type, trigger_at, guild_id)
+                SELECT 'INFRACTION', $2, $3
+                WHERE $1
+                RETURNING id, created_at
+            )
+            INSERT INTO infractions (action_id, inf_type, created_at, expires_at, guild_id, mod_id, target_id, reason)
+            VALUES (
+                (SELECT id FROM new_action),
+                $4,
+                coalesce((SELECT created_at FROM new_action), CURRENT_TIMESTAMP),
+                $2, $3, $5, $6, $7
+            )
             RETURNING *;"""
 
             record = await conn.fetchrow(
                 query,
-                action.id,
-                getattr(infraction.inf_type, "name", None),
-                action.created_at,
+                create_action,
                 infraction.expires_at,
                 infraction.guild_id,
+                getattr(infraction.inf_type, "name", None),
                 infraction.mod_id,
                 infraction.target_id,
                 infraction.reason,
             )
 
-        return Infraction(**record)
+        infraction = Infraction(**record)
+
+        if infraction.action_id is not None:
+            # channel and message ids aren't stored because it is not a reminder
+            action = Action(
+                id=infraction.action_id,
+                action_type=ActionType.INFRACTION,
+                created_at=infraction.created_at,
+                trigger_at=infraction.expires_at,
+                guild_id=infraction.guild_id,
+            )
+            self.bot.actions.push(action)
+
+        return infraction
+
+    async def create_many(self, infractions: List[Infraction]) -> List[Infraction]:
+        """Stores many infractions without actions at once, e.g. ones collected from audit logs"""
+        if not infractions:
+            return []
+
+        async with self.bot.db.pool.acquire() as conn:
+            query = """INSERT INTO infractions (inf_type, expires_at, guild_id, mod_id, target_id, reason)
+            SELECT *
+            FROM unnest($1::infractiontype[], $2::timestamptz[], $3::bigint[], $4::bigint[], $5::bigint[], $6::text[])
+            RETURNING *;"""
+
+            records = await conn.fetch(
+                query,
+                [getattr(inf.inf_type, "name", None) for inf in infractions],
+                [inf.expires_at for inf in infractions],
+                [inf.guild_id for inf in infractions],
+                [inf.mod_id for inf in infractions],
+                [inf.target_id for inf in infractions],
+                [inf.reason for inf in infractions],
+            )
+
+        return [Infraction(**record) for record in records]
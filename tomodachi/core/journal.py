@@ -0,0 +1,149 @@
+#  Copyright (c) 2020 — present, Kirill M.
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import os
+import uuid
+import asyncio
+import logging
+from typing import Any, Dict, List, Tuple, Callable, Iterable, Optional
+
+import orjson
+
+__all__ = ["ActionJournal"]
+
+log = logging.getLogger(__name__)
+
+
+class ActionJournal:
+    """Append-only file which makes entries kept only in memory survive restarts.
+
+    Writes are buffered and flushed with one fsync per batch, the file is compacted
+    once every entry in it is completed or when it mostly consists of completed entries."""
+
+    FLUSH_INTERVAL = 0.05
+    COMPACT_THRESHOLD = 10_000
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        # serialized "add" lines of entries which are not completed yet
+        self.live: Dict[str, bytes] = {}
+        self.records = 0
+
+        self._buffer: List[bytes] = []
+        self._pending = asyncio.Event()
+        self._file = open(path, "ab")
+        # write or compaction currently running in a thread
+        self._io: Optional[asyncio.Future] = None
+        self.task = asyncio.create_task(self.flusher())
+
+    @staticmethod
+    def new_key() -> str:
+        return uuid.uuid4().hex
+
+    def add(self, key: str, payload: Dict[str, Any]):
+        line = orjson.dumps({"op": "add", "key": key, "payload": payload}) + b"\n"
+        self.live[key] = line
+        self._write(line)
+
+    def complete(self, keys: Iterable[str]):
+        keys = [k for k in keys if self.live.pop(k, None) is not None]
+        if keys:
+            self._write(orjson.dumps({"op": "done", "keys": keys}) + b"\n")
+
+    def _write(self, line: bytes):
+        self._buffer.append(line)
+        self.records += 1
+        self._pending.set()
+
+    def replay(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """Reads entries which were added, but weren't completed before the last shutdown"""
+        added: Dict[str, Tuple[bytes, Dict[str, Any]]] = {}
+
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    entry = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    # the last line might be cut by a crash in the middle of write
+                    log.warning("skipping malformed line in the action journal")
+                    continue
+
+                if entry["op"] == "add":
+                    added[entry["key"]] = (line, entry["payload"])
+                elif entry["op"] == "done":
+                    for key in entry["keys"]:
+                        added.pop(key, None)
+
+        self.records = len(added)
+        self.live = {key: line for key, (line, _) in added.items()}
+        return [(key, payload) for key, (_, payload) in added.items()]
+
+    def _append(self, data: bytes):
+        self._file.write(data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _compact(self, lines: List[bytes]):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+
+        self._file.close()
+        os.replace(tmp_path, self.path)
+        self._file = open(self.path, "ab")
+
+        # the rename itself is durable only once the directory is synced
+        dir_fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+    async def _run(self, func: Callable[..., None], *args: Any):
+        # shielded, so cancelling the flusher doesn't leave a thread writing behind the back of close()
+        self._io = asyncio.ensure_future(asyncio.to_thread(func, *args))
+        await asyncio.shield(self._io)
+
+    def should_compact(self) -> bool:
+        if not self.live:
+            return self.records > 0
+        return self.records > self.COMPACT_THRESHOLD and self.records > 2 * len(self.live)
+
+    async def flusher(self):
+        while True:
+            await self._pending.wait()
+            # letting more writes to gather, so they share one fsync
+            await asyncio.sleep(self.FLUSH_INTERVAL)
+            self._pending.clear()
+
+            data, self._buffer = b"".join(self._buffer), []
+
+            try:
+                if self.should_compact():
+                    # live entries already contain everything from the buffer that still matters
+                    lines = list(self.live.values())
+                    self.records = len(lines)
+                    await self._run(self._compact, lines)
+                else:
+                    await self._run(self._append, data)
+            except OSError:
+                log.exception("failed to write the action journal")
+
+    async def close(self):
+        self.task.cancel()
+        if self._io is not None:
+            # its errors were already logged by the flusher, unless it was cancelled before that
+            await asyncio.gather(self._io, return_exceptions=True)
+
+        # writing whatever is left, there won't be another chance
+        if self._buffer:
+            self._append(b"".join(self._buffer))
+            self._buffer = []
+
+        self._file.close()
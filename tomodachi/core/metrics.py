@@ -0,0 +1,152 @@
+#  Copyright (c) 2020 — present, Kirill M.
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import bisect
+from typing import Dict, List, Tuple, Union, Callable, Optional, Sequence
+
+from aiohttp import web
+
+__all__ = ["Counter", "Histogram", "Metrics", "MetricsServer"]
+
+Labels = Tuple[Tuple[str, str], ...]
+
+# from 100 microseconds up to ~30 minutes, every bucket is twice as large as the previous
+DEFAULT_BUCKETS = tuple(0.0001 * 2**i for i in range(25))
+
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [*labels, extra] if extra else list(labels)
+    if not pairs:
+        return ""
+    return "{%s}" % ",".join(f'{k}="{v}"' for k, v in pairs)
+
+
+class Counter:
+    __slots__ = ("name", "labels", "value")
+
+    def __init__(self, name: str, labels: Labels) -> None:
+        self.name = name
+        self.labels = labels
+        self.value = 0
+
+    def inc(self, amount: int = 1):
+        self.value += amount
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labels)} {self.value}"]
+
+
+class Histogram:
+    """Cumulative histogram with fixed buckets, cheap enough to observe on every message"""
+
+    __slots__ = ("name", "labels", "bounds", "counts", "count", "sum", "max")
+
+    def __init__(self, name: str, labels: Labels, bounds: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.name = name
+        self.labels = labels
+        self.bounds = tuple(bounds)
+        # the last slot counts values above the largest bound
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q: float) -> float:
+        """Upper bound of the bucket the q-th percentile falls into"""
+        if not self.count:
+            return 0.0
+
+        rank = q / 100 * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def render(self) -> List[str]:
+        lines = []
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels, ('le', f'{bound:g}'))} {seen}")
+
+        lines.append(f"{self.name}_bucket{_format_labels(self.labels, ('le', '+Inf'))} {self.count}")
+        lines.append(f"{self.name}_sum{_format_labels(self.labels)} {self.sum}")
+        lines.append(f"{self.name}_count{_format_labels(self.labels)} {self.count}")
+        return lines
+
+
+Metric = Union[Counter, Histogram]
+
+
+class Metrics:
+    """Registry of in-memory metrics, rendered in prometheus text format"""
+
+    def __init__(self) -> None:
+        self._metrics: Dict[Tuple[str, Labels], Metric] = {}
+        self._gauges: Dict[str, Callable[[], float]] = {}
+
+    def _get(self, cls, name: str, labels: Dict[str, str], **kwargs) -> Metric:
+        key = (name, tuple(sorted(labels.items())))
+        if (metric := self._metrics.get(key)) is None:
+            metric = self._metrics[key] = cls(name, key[1], **kwargs)
+        return metric
+
+    def counter(self, name: str, **labels: str) -> Counter:
+        return self._get(Counter, name, labels)
+
+    def histogram(self, name: str, *, bounds: Sequence[float] = DEFAULT_BUCKETS, **labels: str) -> Histogram:
+        return self._get(Histogram, name, labels, bounds=bounds)
+
+    def gauge(self, name: str, callback: Callable[[], float]):
+        """Registers a value which is read only when metrics are rendered"""
+        self._gauges[name] = callback
+
+    def find(self, name: str) -> List[Metric]:
+        return [metric for (metric_name, _), metric in self._metrics.items() if metric_name == name]
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        for name, callback in self._gauges.items():
+            lines.append(f"{name} {callback()}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    def __init__(self, metrics: Metrics, *, host: str, port: int) -> None:
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+
+        self.app = web.Application()
+        self.app.router.add_get("/metrics", self.handle_metrics)
+        self.runner = web.AppRunner(self.app, access_log=None)
+
+    async def handle_metrics(self, _request: web.Request) -> web.Response:
+        return web.Response(text=self.metrics.render(), content_type="text/plain")
+
+    async def start(self):
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port)
+        await site.start()
+
+    async def close(self):
+        await self.runner.cleanup()
@@ -0,0 +1,41 @@
+#  Copyright (c) 2020 — present, Kirill M.
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+from typing import Tuple
+
+import discord
+
+from tomodachi.utils.lru import LRUCache
+
+__all__ = ["OwnModActions"]
+
+ModActionKey = Tuple[int, int, discord.AuditLogAction]
+
+
+class OwnModActions:
+    """Moderation actions the bot is performing itself, so their gateway echoes are ignored"""
+
+    # the echo usually arrives within a second, the rest is a safety margin
+    EXPIRY = 30.0
+
+    def __init__(self) -> None:
+        self._pending: LRUCache[ModActionKey, bool] = LRUCache(10_000, self.EXPIRY)
+
+    def expect(self, guild_id: int, target_id: int, action: discord.AuditLogAction):
+        self._pending.set((guild_id, target_id, action), True)
+
+    def forget(self, guild_id: int, target_id: int, action: discord.AuditLogAction):
+        self._pending.pop((guild_id, target_id, action))
+
+    def consume(self, guild_id: int, target_id: int, action: discord.AuditLogAction) -> bool:
+        """Checks whether the action was performed by the bot, every action is consumed once"""
+        key = (guild_id, target_id, action)
+        if key not in self._pending:
+            return False
+
+        self._pending.pop(key)
+        return True
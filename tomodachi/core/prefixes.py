@@ -0,0 +1,87 @@
+#  Copyright (c) 2020 — present, Kirill M.
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Dict, Tuple, Counter, Optional
+
+if TYPE_CHECKING:
+    from discord import Message
+
+__all__ = ["PrefixIndex"]
+
+
+class PrefixIndex:
+    """In-memory copy of prefixes in use, lets the bot reject ordinary chat without awaiting anything"""
+
+    def __init__(self, default: str) -> None:
+        self.default = default
+        self.mentions: Tuple[str, ...] = ()
+        self.checked = 0
+        self.rejected = 0
+
+        self._prefixes: Dict[int, str] = {}
+        # first characters of every prefix in use, counted to support removals
+        self._first_chars: Counter[str] = Counter({default[0]: 1})
+
+    def __len__(self) -> int:
+        return len(self._prefixes)
+
+    @property
+    def rejection_rate(self) -> float:
+        if not self.checked:
+            return 0.0
+        return self.rejected / self.checked
+
+    def set_user(self, user_id: int):
+        if not self.mentions:
+            self._first_chars["<"] += 1
+        self.mentions = (f"<@!{user_id}> ", f"<@{user_id}> ")
+
+    def set(self, guild_id: int, prefix: Optional[str]):
+        prefix = prefix or self.default
+        self.discard(guild_id)
+        self._prefixes[guild_id] = prefix
+        self._first_chars[prefix[0]] += 1
+
+    def discard(self, guild_id: int):
+        prefix = self._prefixes.pop(guild_id, None)
+        if prefix is None:
+            return
+
+        self._first_chars[prefix[0]] -= 1
+        if self._first_chars[prefix[0]] <= 0:
+            del self._first_chars[prefix[0]]
+
+    def clear(self):
+        self._prefixes.clear()
+        self._first_chars = Counter({self.default[0]: 1})
+        if self.mentions:
+            self._first_chars["<"] += 1
+
+    def may_be_command(self, message: Message) -> bool:
+        # until the bot knows its own mentions nothing can be rejected safely
+        if not self.mentions:
+            return True
+
+        self.checked += 1
+        content = message.content
+
+        if message.guild is None:
+            prefix = self.default
+        elif (prefix := self._prefixes.get(message.guild.id)) is None:
+            # the guild wasn't indexed yet or was discarded, the full lookup has to decide
+            # and its prefix might not be among the first characters anymore
+            return True
+
+        if not content or content[0] not in self._first_chars:
+            self.rejected += 1
+            return False
+
+        if not content.startswith((prefix, *self.mentions)):
+            self.rejected += 1
+            return False
+
+        return True
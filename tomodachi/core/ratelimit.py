@@ -0,0 +1,135 @@
+#  Copyright (c) 2020 — present, Kirill M.
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import time
+import logging
+from typing import TYPE_CHECKING, List, Optional
+
+import discord
+import aioredis
+from discord.ext import commands
+
+from tomodachi.utils.lru import LRUCache
+
+if TYPE_CHECKING:
+    from tomodachi.core.bot import Tomodachi
+
+__all__ = ["RateLimiter"]
+
+log = logging.getLogger(__name__)
+
+# refills the bucket for the time passed since the last check, charges requests let through locally
+# and then takes a token if there is one, time is taken from redis itself, so clocks of processes don't matter
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local refill_per_ms = tonumber(ARGV[2])
+local debt = tonumber(ARGV[3])
+
+local time = redis.call("time")
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+local bucket = redis.call("hmget", KEYS[1], "tokens", "ts")
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+-- debt might take the bucket below zero, it's paid off by the following refills
+tokens = math.min(capacity, tokens + math.max(now - ts, 0) * refill_per_ms) - debt
+
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    retry_after = (1 - tokens) / refill_per_ms
+end
+
+redis.call("hset", KEYS[1], "tokens", tokens, "ts", now)
+redis.call("pexpire", KEYS[1], math.ceil((capacity - tokens) / refill_per_ms) + 1000)
+return {tostring(tokens), tostring(retry_after)}
+"""
+
+
+class RateLimiter:
+    """Token bucket per user, shared by every bot process through redis.
+
+    Users with plenty of tokens left are let through locally for a short while,
+    the requests let through this way are charged on the next trip to redis."""
+
+    KEY_PREFIX = "tomodachi:ratelimit"
+    # how long the last known amount of tokens is trusted
+    LOCAL_WINDOW = 1.0
+    MAX_LOCAL_ENTRIES = 10_000
+
+    def __init__(self, bot: Tomodachi, *, rate: int, per: float) -> None:
+        self.bot = bot
+        self.rate = rate
+        self.per = per
+        self._script = bot.cache.redis.register_script(TOKEN_BUCKET_SCRIPT)
+        # user id -> [tokens left in redis, monotonic time of the check, requests let through locally since]
+        self._local: LRUCache[int, List[float]] = LRUCache(self.MAX_LOCAL_ENTRIES)
+        # used while redis is unreachable
+        self.redis_down = False
+        self.fallback = commands.CooldownMapping.from_cooldown(rate, per, commands.BucketType.user)
+
+        metrics = bot.metrics
+        self.checks = {
+            path: metrics.counter("ratelimit_checks_total", path=path) for path in ("local", "redis", "fallback")
+        }
+
+    def make_key(self, user_id: int) -> str:
+        return f"{self.KEY_PREFIX}:{user_id}"
+
+    def check_locally(self, user_id: int) -> bool:
+        entry = self._local.get(user_id)
+        if entry is None:
+            return False
+
+        tokens, checked_at, debt = entry
+        if time.monotonic() - checked_at > self.LOCAL_WINDOW:
+            return False
+
+        # other processes might spend tokens meanwhile, so only the upper half of the bucket is used locally
+        if tokens - debt - 1 < self.rate / 2:
+            return False
+
+        entry[2] += 1
+        return True
+
+    async def hit(self, message: discord.Message) -> Optional[float]:
+        """Takes a token of the message author, returns how long to wait if there are none left"""
+        user_id = message.author.id
+
+        if self.check_locally(user_id):
+            self.checks["local"].inc()
+            return None
+
+        entry = self._local.get(user_id)
+        debt = 0
+        if entry is not None:
+            # the debt is handed over to redis, concurrent checks must not charge it again
+            debt, entry[2] = entry[2], 0
+
+        try:
+            tokens, retry_after = await self._script(
+                keys=[self.make_key(user_id)], args=[self.rate, self.rate / (self.per * 1000), debt]
+            )
+        except (aioredis.ConnectionError, aioredis.TimeoutError):
+            if not self.redis_down:
+                log.warning("redis is unreachable or not responding, falling back to the local rate limiter")
+                self.redis_down = True
+
+            self.checks["fallback"].inc()
+            return self.fallback.get_bucket(message).update_rate_limit()
+
+        self.redis_down = False
+        self.checks["redis"].inc()
+        if (entry := self._local.get(user_id)) is not None:
+            # keeping the debt of requests let through locally while waiting for redis
+            entry[0], entry[1] = float(tokens), time.monotonic()
+        else:
+            self._local.set(user_id, [float(tokens), time.monotonic(), 0])
+
+        retry_after = float(retry_after) / 1000
+        return retry_after or None
@@ -0,0 +1,104 @@
+#  Copyright (c) 2020 — present, Kirill M.
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import asyncio
+from typing import TYPE_CHECKING, Any, Dict, Tuple, Callable, Hashable, Iterable, Awaitable
+
+import discord
+
+from tomodachi.utils.lru import LRUCache
+from tomodachi.utils.singleflight import SingleFlight
+
+if TYPE_CHECKING:
+    from tomodachi.core.bot import Tomodachi
+
+__all__ = ["EntityResolver"]
+
+_MISSING: Any = object()
+
+
+class EntityResolver:
+    """Resolves discord entities from the gateway cache, falling back to REST.
+
+    Fetched users, guilds, channels and 404s are remembered for a while, identical fetches
+    running at the same time share one request."""
+
+    MAXSIZE = 5000
+    TTL = 600.0
+    # entities which weren't found are unlikely to appear soon, but might
+    NEGATIVE_TTL = 300.0
+    # how many requests a batch may run at once, the rest waits for its turn
+    BATCH_CONCURRENCY = 5
+
+    def __init__(self, bot: Tomodachi) -> None:
+        self.bot = bot
+        self._cache: LRUCache[Tuple[Hashable, ...], Any] = LRUCache(self.MAXSIZE, self.TTL)
+        self._fetches: SingleFlight[Tuple[Hashable, ...], Any] = SingleFlight()
+
+    async def _resolve(self, key: Tuple[Hashable, ...], fetch: Callable[[], Awaitable[Any]]) -> Any:
+        if (cached := self._cache.get(key, _MISSING)) is not _MISSING:
+            if isinstance(cached, discord.NotFound):
+                raise cached.with_traceback(None)
+            return cached
+
+        return await self._fetches.run(key, lambda: self._fetch(key, fetch))
+
+    async def _fetch(self, key: Tuple[Hashable, ...], fetch: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            entity = await fetch()
+        except discord.NotFound as e:
+            self._cache.set(key, e, ttl=self.NEGATIVE_TTL)
+            raise
+
+        self._cache.set(key, entity)
+        return entity
+
+    async def user(self, user_id: int) -> discord.User:
+        if (user := self.bot.get_user(user_id)) is not None:
+            return user
+        return await self._resolve(("user", user_id), lambda: self.bot.fetch_user(user_id))
+
+    async def member(self, guild: discord.Guild, user_id: int) -> discord.Member:
+        if (member := guild.get_member(user_id)) is not None:
+            return member
+        # roles of members change without notice, so fetched members are only shared, but never cached
+        return await self._fetches.run(("member", guild.id, user_id), lambda: guild.fetch_member(user_id))
+
+    async def guild(self, guild_id: int) -> discord.Guild:
+        if (guild := self.bot.get_guild(guild_id)) is not None:
+            return guild
+        return await self._resolve(("guild", guild_id), lambda: self.bot.fetch_guild(guild_id))
+
+    async def channel(self, channel_id: int):
+        if (channel := self.bot.get_channel(channel_id)) is not None:
+            return channel
+        return await self._resolve(("channel", channel_id), lambda: self.bot.fetch_channel(channel_id))
+
+    async def users(self, user_ids: Iterable[int]) -> Dict[int, discord.User]:
+        """Resolves many users at once, users that don't exist are left out"""
+        resolved: Dict[int, discord.User] = {}
+        missing = []
+
+        for user_id in dict.fromkeys(user_ids):
+            if (user := self.bot.get_user(user_id)) is not None:
+                resolved[user_id] = user
+            elif isinstance(cached := self._cache.get(("user", user_id)), discord.User):
+                resolved[user_id] = cached
+            else:
+                missing.append(user_id)
+
+        semaphore = asyncio.Semaphore(self.BATCH_CONCURRENCY)
+
+        async def fetch(user_id: int):
+            async with semaphore:
+                try:
+                    resolved[user_id] = await self.user(user_id)
+                except discord.NotFound:
+                    pass
+
+        await asyncio.gather(*(fetch(user_id) for user_id in missing))
+        return resolved
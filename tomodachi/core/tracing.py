@@ -0,0 +1,88 @@
+#  Copyright (c) 2020 — present, Kirill M.
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import time
+from typing import Dict, Tuple, Optional
+from contextvars import Token, ContextVar
+
+from tomodachi.core.metrics import Metrics, Histogram
+
+__all__ = ["Stage", "Trace", "Tracer", "stage"]
+
+# commands without a trace record nothing, so stages can be used anywhere
+current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+
+
+class Stage:
+    __slots__ = ("trace", "name", "started_at")
+
+    def __init__(self, trace: Optional[Trace], name: str) -> None:
+        self.trace = trace
+        self.name = name
+
+    def start(self) -> Stage:
+        self.started_at = time.perf_counter()
+        return self
+
+    def stop(self):
+        if self.trace is not None:
+            self.trace.add(self.name, time.perf_counter() - self.started_at)
+
+    def __enter__(self):
+        self.start()
+
+    def __exit__(self, *_):
+        self.stop()
+
+
+class Trace:
+    """Time spent in every stage of handling one message, stages may nest and repeat"""
+
+    __slots__ = ("command", "stages", "token")
+
+    def __init__(self) -> None:
+        self.command = "<none>"
+        self.stages: Dict[str, float] = {}
+        self.token: Optional[Token] = None
+
+    def add(self, name: str, elapsed: float):
+        self.stages[name] = self.stages.get(name, 0.0) + elapsed
+
+    def stage(self, name: str) -> Stage:
+        return Stage(self, name)
+
+
+def stage(name: str) -> Stage:
+    """Times a block as a stage of the message currently being handled, if there's one"""
+    return Stage(current_trace.get(), name)
+
+
+class Tracer:
+    """Collects traces into histograms per command and stage"""
+
+    def __init__(self, metrics: Metrics) -> None:
+        self.metrics = metrics
+        self._histograms: Dict[Tuple[str, str], Histogram] = {}
+
+    def start(self) -> Trace:
+        trace = Trace()
+        trace.token = current_trace.set(trace)
+        return trace
+
+    def finish(self, trace: Trace):
+        current_trace.reset(trace.token)
+
+        for name, elapsed in trace.stages.items():
+            key = (trace.command, name)
+            if (histogram := self._histograms.get(key)) is None:
+                histogram = self._histograms[key] = self.metrics.histogram(
+                    "command_stage_seconds", command=trace.command, stage=name
+                )
+            histogram.observe(elapsed)
+
+    def histograms(self, command: Optional[str] = None) -> Dict[Tuple[str, str], Histogram]:
+        return {key: h for key, h in self._histograms.items() if command is None or key[0] == command}
@@ -3,7 +3,10 @@
 #  License, v. 2.0. If a copy of the MPL was not distributed with this
 #  file, You can obtain one at https://mozilla.org/MPL/2.0/.
 
-from typing import Union
+import asyncio
+import logging
+from typing import Dict, List, Tuple, Union
+from datetime import datetime, timedelta
 
 import discord
 from discord.ext import commands
@@ -12,9 +15,26 @@ from tomodachi.core import CogMixin
 from tomodachi.utils import helpers, timestamp
 from tomodachi.core.enums import ActionType, InfractionType
 from tomodachi.core.actions import Action
+from tomodachi.core.infractions import Infraction
+
+log = logging.getLogger(__name__)
 
 
 class Events(CogMixin):
+    # mod actions of a guild are collected for this long, then matched with audit logs at once
+    AUDIT_DEBOUNCE = 2.0
+    # audit entries are looked up starting slightly before the first collected action
+    AUDIT_MARGIN = timedelta(seconds=10)
+
+    def __init__(self, /, tomodachi):
+        super().__init__(tomodachi)
+        self.pending_mod_actions: Dict[int, Dict[Tuple[discord.AuditLogAction, int], InfractionType]] = {}
+        self.audit_collectors: Dict[int, asyncio.Task] = {}
+
+    def cog_unload(self):
+        for task in self.audit_collectors.values():
+            task.cancel()
+
     @commands.Cog.listener()
     async def on_guild_join(self, guild: discord.Guild):
         await self.bot.db.store_guild(guild.id)
@@ -27,12 +47,12 @@ class Events(CogMixin):
             return
 
         try:
-            channel = self.bot.get_channel(action.id) or await self.bot.fetch_channel(action.channel_id)
+            channel = await self.bot.resolver.channel(action.channel_id)
         except (discord.NotFound, discord.Forbidden, discord.HTTPException):
             channel = None
 
         try:
-            author = self.bot.get_user(action.author_id) or await self.bot.fetch_user(action.author_id)
+            author = await self.bot.resolver.user(action.author_id)
         except discord.NotFound:
             return
 
@@ -55,10 +75,11 @@ class Events(CogMixin):
             pass
 
     async def _disable_audit_infractions(self, guild_id: int):
-        async with self.bot.cache.settings.fresh(guild_id):
-            async with self.bot.db.pool.acquire() as conn:
-                query = "update mod_settings set audit_infractions=false where guild_id=$1;"
-                await conn.execute(query, guild_id)
+        async with self.bot.db.pool.acquire() as conn:
+            query = "update mod_settings set audit_infractions=false where guild_id=$1 returning audit_infractions;"
+            result = await conn.fetchval(query, guild_id)
+
+        await self.bot.cache.settings.update(guild_id, audit_infractions=result)
 
     @commands.Cog.listener()
     async def on_mod_action(
@@ -68,31 +89,74 @@ class Events(CogMixin):
         guild: discord.Guild,
         user: Union[discord.User, discord.Member],
     ):
-        settings = await self.bot.cache.settings.get(guild.id)
-        if not settings.audit_infractions:
+        # echoes of actions performed by the bot itself would be ignored after the lookup anyway
+        if self.bot.own_mod_actions.consume(guild.id, user.id, action):
             return
 
-        if not guild.me.guild_permissions.view_audit_log:
-            return await self._disable_audit_infractions(guild.id)
+        # a burst of bans is matched with audit logs at once, instead of one request per ban
+        pending = self.pending_mod_actions.setdefault(guild.id, {})
+        pending[(action, user.id)] = type
 
-        audits = await guild.audit_logs(limit=1, oldest_first=False, action=action).flatten()
-        if not audits:
-            raise Exception(f"Audit entry was not found for {action.name} of {user.id}")  # noqa
-        entry = audits[0]
+        if guild.id not in self.audit_collectors:
+            self.audit_collectors[guild.id] = asyncio.create_task(self.collect_audit_infractions(guild))
 
-        # ignore actions of tomodachi bot
-        if entry.user.id == self.bot.user.id:
-            return
+    async def collect_audit_infractions(self, guild: discord.Guild):
+        since = helpers.utcnow() - self.AUDIT_MARGIN
+        try:
+            await asyncio.sleep(self.AUDIT_DEBOUNCE)
+        finally:
+            # anything that happens from now on is collected by a new task
+            pending = self.pending_mod_actions.pop(guild.id, {})
+            del self.audit_collectors[guild.id]
 
-        await self.bot.infractions.create(
-            inf_type=type,
-            expires_at=None,
-            guild_id=guild.id,
-            mod_id=entry.user.id,
-            target_id=entry.target.id,
-            reason=entry.reason or f"Manual {action.name} with no reason.",  # noqa
-            create_action=False,
-        )
+        try:
+            infractions = await self.match_audit_entries(guild, pending, since)
+            await self.bot.infractions.create_many(infractions)
+        except Exception:  # noqa
+            log.exception(f"failed to store audit log infractions of {guild.id}")
+
+    async def match_audit_entries(
+        self,
+        guild: discord.Guild,
+        pending: Dict[Tuple[discord.AuditLogAction, int], InfractionType],
+        since: datetime,
+    ) -> List[Infraction]:
+        settings = await self.bot.cache.settings.get(guild.id)
+        if not settings.audit_infractions:
+            return []
+
+        if not guild.me.guild_permissions.view_audit_log:
+            await self._disable_audit_infractions(guild.id)
+            return []
+
+        matched: Dict[Tuple[discord.AuditLogAction, int], discord.AuditLogEntry] = {}
+
+        for action in {action for action, _ in pending}:
+            # entries come oldest first, so the latest entry of a target wins
+            async for entry in guild.audit_logs(limit=None, after=since, action=action):
+                if entry.target is not None and (action, entry.target.id) in pending:
+                    matched[(action, entry.target.id)] = entry
+
+        if len(matched) < len(pending):
+            log.debug(f"{len(pending) - len(matched)} audit entries of {guild.id} were not found")
+
+        infractions = []
+        for (action, target_id), entry in matched.items():
+            # ignore actions of tomodachi bot
+            if entry.user.id == self.bot.user.id:
+                continue
+
+            infraction = Infraction(
+                inf_type=pending[(action, target_id)],
+                expires_at=None,
+                guild_id=guild.id,
+                mod_id=entry.user.id,
+                target_id=target_id,
+                reason=entry.reason or f"Manual {action.name} with no reason.",  # noqa
+            )
+            infractions.append(infraction)
+
+        return infractions
 
     @commands.Cog.listener()
     async def on_member_ban(self, guild, user):
@@ -143,7 +143,12 @@ class TomodachiHelpCommand(commands.MinimalHelpCommand):
         if description:
             embed.description = re.sub(PREFIX_PLACEHOLDER, self.context.prefix, description)
 
-        if cooldown := command._buckets._cooldown:  # noqa
+        if isinstance(command.cog, CogMixin):
+            cooldown = command.cog.get_cooldown(command)
+        else:
+            cooldown = command._buckets._cooldown  # noqa
+
+        if cooldown:
             embed.add_field(name="Cooldown", value=f"{i:slowmode} {int(cooldown.per)} seconds")
 
         if command.aliases:
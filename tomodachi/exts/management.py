@@ -50,10 +50,11 @@ class Management(CogMixin, icon="\N{HAMMER AND WRENCH}", colour=0xF4900C):
             await ctx.send(f"\U0001F50E DMs on moderation actions are currently **{humanbool(settings.dm_targets)}**.")
             return
 
-        async with self.bot.cache.settings.fresh(ctx.guild.id):
-            async with self.bot.db.pool.acquire() as conn:
-                query = "update mod_settings set dm_targets=$2 where guild_id=$1 returning dm_targets;"
-                result = await conn.fetchval(query, ctx.guild.id, mode)
+        async with self.bot.db.pool.acquire() as conn:
+            query = "update mod_settings set dm_targets=$2 where guild_id=$1 returning dm_targets;"
+            result = await conn.fetchval(query, ctx.guild.id, mode)
+
+        await self.bot.cache.settings.update(ctx.guild.id, dm_targets=result)
 
         await ctx.send(f"\U0001F44C DMs on moderation actions has been **{humanbool(result)}**.")
 
@@ -81,15 +82,16 @@ class Management(CogMixin, icon="\N{HAMMER AND WRENCH}", colour=0xF4900C):
         if not to_add:
             return await ctx.send(":x: Nothing changed. Make sure that provided roles aren't Mod Roles already!")
 
-        async with self.bot.cache.settings.fresh(ctx.guild.id):
-            async with self.bot.db.pool.acquire() as conn:
-                query = """insert into mod_settings as ms (guild_id, mod_roles) values ($1, $2)
-                    on conflict (guild_id) do update set mod_roles = ms.mod_roles || $2::bigint[]
-                    returning true;"""
+        async with self.bot.db.pool.acquire() as conn:
+            query = """insert into mod_settings as ms (guild_id, mod_roles) values ($1, $2)
+                on conflict (guild_id) do update set mod_roles = ms.mod_roles || $2::bigint[]
+                returning ms.mod_roles;"""
+
+            mod_roles = await conn.fetchval(query, ctx.guild.id, [r.id for r in to_add])
 
-                is_added = await conn.fetchval(query, ctx.guild.id, [r.id for r in to_add])
+        if mod_roles is not None:
+            await self.bot.cache.settings.update(ctx.guild.id, mod_roles=mod_roles)
 
-        if is_added:
             e = discord.Embed(
                 colour=discord.Colour.green(),
                 description="\n".join(f"+ {r.mention} (`{r.id}`)" for r in to_add),
@@ -105,16 +107,17 @@ class Management(CogMixin, icon="\N{HAMMER AND WRENCH}", colour=0xF4900C):
         if not to_delete:
             return await ctx.send(":x: Provided roles are not Mod Roles.")
 
-        async with self.bot.cache.settings.fresh(ctx.guild.id):
-            async with self.bot.db.pool.acquire() as conn:
-                query = """update mod_settings as ms
-                    set mod_roles = (select array(select unnest(ms.mod_roles) except select unnest($2::bigint[])))
-                    where guild_id = $1
-                    returning true;"""
+        async with self.bot.db.pool.acquire() as conn:
+            query = """update mod_settings as ms
+                set mod_roles = (select array(select unnest(ms.mod_roles) except select unnest($2::bigint[])))
+                where guild_id = $1
+                returning ms.mod_roles;"""
 
-                removed = await conn.fetchval(query, ctx.guild.id, [r.id for r in to_delete])
+            mod_roles = await conn.fetchval(query, ctx.guild.id, [r.id for r in to_delete])
+
+        if mod_roles is not None:
+            await self.bot.cache.settings.update(ctx.guild.id, mod_roles=mod_roles)
 
-        if removed:
             e = discord.Embed(
                 colour=discord.Colour.red(),
                 description="\n".join(f"- {r.mention} (`{r.id}`)" for r in to_delete),
@@ -133,13 +136,14 @@ class Management(CogMixin, icon="\N{HAMMER AND WRENCH}", colour=0xF4900C):
             )
             return
 
-        async with self.bot.cache.settings.fresh(ctx.guild.id):
-            async with self.bot.db.pool.acquire() as conn:
-                query = """update mod_settings as ms
-                    set audit_infractions=$2
-                    where guild_id=$1
-                    returning ms.audit_infractions;"""
-                result = await conn.fetchval(query, ctx.guild.id, mode)
+        async with self.bot.db.pool.acquire() as conn:
+            query = """update mod_settings as ms
+                set audit_infractions=$2
+                where guild_id=$1
+                returning ms.audit_infractions;"""
+            result = await conn.fetchval(query, ctx.guild.id, mode)
+
+        await self.bot.cache.settings.update(ctx.guild.id, audit_infractions=result)
 
         await ctx.send(f"\U0001F44C Automatic Infractions has been **{humanbool(result)}**.")
 
@@ -5,6 +5,8 @@
 
 from __future__ import annotations
 
+import asyncio
+import logging
 import textwrap
 from typing import TYPE_CHECKING, List, Union, Optional
 from datetime import datetime
@@ -19,17 +21,75 @@ from tomodachi.core.enums import InfractionType
 from tomodachi.utils.converters import BannedUser, TimeUnit, uint
 
 if TYPE_CHECKING:
+    from tomodachi.core.bot import Tomodachi
     from tomodachi.core.infractions import Infraction
 
+log = logging.getLogger(__name__)
+
 MemberUser = Union[discord.Member, discord.User]
 
 
-class MySource(menus.ListPageSource):
-    def __init__(self, data: List[Infraction]):
-        super().__init__(data, per_page=10)
+class InfractionSource(menus.PageSource):
+    """Loads infractions page by page as the menu goes, always keeping the next page prefetched"""
+
+    def __init__(self, bot: Tomodachi, guild_id: int, *, per_page: int = 10, **filters: Optional[int]):
+        self.bot = bot
+        self.guild_id = guild_id
+        self.per_page = per_page
+        self.filters = filters
+        self.pages: List[List[Infraction]] = []
+        self.exhausted = False
+
+        self._lock = asyncio.Lock()
+        self._prefetch: Optional[asyncio.Task] = None
+
         self.header = f"{'ID': <6} | {'Type': <10} | {'Intruder ID': <18} | {'Moderator ID': <18} | {'Timestamp (UTC)': <20} | Reason"
         self.border = f"{'-'*7}|{'-'*12}|{'-'*20}|{'-'*20}|{'-'*22}|{'-'*10}"
 
+    async def load_pages(self, count: int):
+        async with self._lock:
+            # a prefetch might have loaded some pages while waiting for the lock
+            while len(self.pages) < count and not self.exhausted:
+                # keyset pagination, the last seen id is the cursor
+                before = self.pages[-1][-1].id if self.pages else None
+                page = await self.bot.infractions.search(
+                    self.guild_id, before=before, limit=self.per_page, **self.filters
+                )
+
+                if page:
+                    self.pages.append(page)
+                self.exhausted = len(page) < self.per_page
+
+    def is_paginating(self):
+        return not self.exhausted or len(self.pages) > 1
+
+    def get_max_pages(self):
+        # unknown until the last page is loaded
+        return len(self.pages) if self.exhausted else None
+
+    async def get_page(self, page_number: int):
+        # the menu doesn't check bounds while the page count is unknown
+        if page_number < 0:
+            raise IndexError(page_number)
+
+        await self.load_pages(page_number + 1)
+
+        if page_number >= len(self.pages):
+            raise IndexError(page_number)
+
+        if page_number + 1 == len(self.pages) and not self.exhausted and self._prefetch is None:
+            self._prefetch = asyncio.create_task(self.load_pages(page_number + 2))
+            self._prefetch.add_done_callback(self._on_prefetched)
+
+        return self.pages[page_number]
+
+    def _on_prefetched(self, task: asyncio.Task):
+        self._prefetch = None
+
+        # the page is loaded again when it's requested, the failure is only logged
+        if not task.cancelled() and (exc := task.exception()) is not None:
+            log.error(f"failed to prefetch infractions of {self.guild_id}", exc_info=exc)
+
     @staticmethod
     def make_row(entry: Infraction):
         human_timestamp = entry.created_at.strftime("%Y-%m-%d %H:%M:%S")
@@ -39,7 +99,7 @@ class MySource(menus.ListPageSource):
     async def format_page(self, menu: menus.MenuPages, entries: List[Infraction]):
         rows = [self.make_row(entry) for entry in entries]
         table = "```\n{0}\n```".format("\n".join([self.header, self.border, *rows]))
-        page = f"Page {menu.current_page+1}/{self.get_max_pages()}"
+        page = f"Page {menu.current_page+1}/{self.get_max_pages() or '?'}"
         return f"{table}{page}"
 
 
@@ -81,6 +141,7 @@ class Moderation(
         if infraction.inf_type is InfractionType.TEMPBAN:
             try:
                 reason = f"Infraction #{infraction.id} has expired."
+                self.bot.own_mod_actions.expect(guild.id, obj.id, discord.AuditLogAction.unban)
                 await guild.unban(user=obj, reason=reason)
                 await self.bot.infractions.create(
                     inf_type=InfractionType.UNBAN,
@@ -92,6 +153,7 @@ class Moderation(
                     create_action=False,
                 )
             except (discord.Forbidden, discord.HTTPException):
+                self.bot.own_mod_actions.forget(guild.id, obj.id, discord.AuditLogAction.unban)
                 return  # todo: once modlogs are created, log this to inform mods about failure
 
     @commands.command(aliases=["permaban"])
@@ -101,9 +163,12 @@ class Moderation(
         """Permanently bans a user from the server"""
         reason = reason or "No reason."
 
+        # the gateway echoes the ban, there's no need to look it up in audit logs
+        self.bot.own_mod_actions.expect(ctx.guild.id, target.id, discord.AuditLogAction.ban)
         try:
             await ctx.guild.ban(target, reason=self.make_audit_reason(f"{ctx.author} ({ctx.author.id})", reason))
         except (discord.Forbidden, discord.HTTPException):
+            self.bot.own_mod_actions.forget(ctx.guild.id, target.id, discord.AuditLogAction.ban)
             raise
 
         inf = await self.bot.infractions.create(
@@ -129,10 +194,12 @@ class Moderation(
         unban_at = helpers.utcnow() + duration
         when = timestamp(unban_at)
 
+        self.bot.own_mod_actions.expect(ctx.guild.id, target.id, discord.AuditLogAction.ban)
         try:
             audit_reason = self.make_audit_reason(f"{ctx.author} ({ctx.author.id})", reason, until=unban_at)
             await ctx.guild.ban(target, reason=audit_reason)
         except (discord.Forbidden, discord.HTTPException):
+            self.bot.own_mod_actions.forget(ctx.guild.id, target.id, discord.AuditLogAction.ban)
             raise
 
         inf = await self.bot.infractions.create(
@@ -179,7 +246,13 @@ class Moderation(
     async def unban(self, ctx: TomodachiContext, target: BannedUser, *, reason: str = None):
         """Removes a ban from specified user"""
         reason = reason or "No reason."
-        await ctx.guild.unban(target, reason=self.make_audit_reason(f"{ctx.author} ({ctx.author.id})", reason))
+
+        self.bot.own_mod_actions.expect(ctx.guild.id, target.id, discord.AuditLogAction.unban)
+        try:
+            await ctx.guild.unban(target, reason=self.make_audit_reason(f"{ctx.author} ({ctx.author.id})", reason))
+        except (discord.Forbidden, discord.HTTPException):
+            self.bot.own_mod_actions.forget(ctx.guild.id, target.id, discord.AuditLogAction.unban)
+            raise
 
         inf = await self.bot.infractions.create(
             inf_type=InfractionType.UNBAN,
@@ -231,8 +304,11 @@ class Moderation(
             return await ctx.send(":x: Nothing was found for this query.")
         inf = data[0]
 
-        target = await self.bot.get_or_fetch_user(inf.target_id)
-        moderator = await self.bot.get_or_fetch_user(inf.mod_id)
+        users = await self.bot.resolver.users([inf.target_id, inf.mod_id])
+        if inf.target_id not in users or inf.mod_id not in users:
+            return await ctx.send(":x: Users of this infraction couldn't be found.")
+
+        target, moderator = users[inf.target_id], users[inf.mod_id]
 
         embed = discord.Embed(colour=discord.Colour.blurple())
         embed.set_thumbnail(url=getattr(target.avatar, "url", EmptyEmbed))
@@ -264,11 +340,27 @@ class Moderation(
 
         await ctx.send(embed=embed)
 
+    @infractions.command(name="summary", aliases=["stats"])
+    @commands.cooldown(1, 5.0, commands.BucketType.member)
+    async def infractions_summary(self, ctx: TomodachiContext, *, target: MemberUser):
+        """Shows how many infractions of each type someone has received and issued on this server."""
+        summary = await self.bot.infractions.summary(ctx.guild.id, target.id)
+
+        embed = discord.Embed(colour=discord.Colour.blurple())
+        embed.set_author(name=f"{target}", icon_url=getattr(target.avatar, "url", EmptyEmbed))
+        embed.set_footer(text=f"{target.id}")
+
+        received = "\n".join(f"{inf_type.name.title()}: **{count}**" for inf_type, count in summary.received.items())
+        embed.add_field(name=f"Received ({summary.total})", value=received or "Nothing.", inline=False)
+        embed.add_field(name="Issued as moderator", value=f"**{summary.issued}**", inline=False)
+
+        await ctx.send(embed=embed)
+
     @infractions.command(name="search")
     async def infractions_search(self, ctx: TomodachiContext, *, flags: InfractionSearchFlags):
         """Searches through infractions history.
 
-        This command uses a command line syntax. You will be able to review up to 500 infraction records.
+        This command uses a command line syntax. Infractions are loaded page by page, newest first.
 
         Available options:
         `--id [number]` — unique infraction identifier
@@ -281,18 +373,20 @@ class Moderation(
         `%prefix%infractions search --mod @Tomodachi#9184`
         `%prefix%infractions search --id 12345`
 
-        If you don't specify any flags, you will get information about the last 500 infractions on the server."""
-        inf_ls = await self.bot.infractions.get(
+        If you don't specify any flags, you will get all infractions on the server."""
+        src = InfractionSource(
+            self.bot,
             ctx.guild.id,
             inf_id=flags.id,
             target_id=getattr(flags.target, "id", None),
             mod_id=getattr(flags.mod, "id", None),
         )
 
-        if not inf_ls:
+        try:
+            await src.get_page(0)
+        except IndexError:
             return await ctx.send(":x: Nothing was found!")
 
-        src = MySource(inf_ls)
         menu = menus.MenuPages(src, clear_reactions_after=True)
         await menu.start(ctx)
 
@@ -9,7 +9,6 @@ import asyncio
 
 import discord
 from discord.ext import commands
-from asyncpg.exceptions import UniqueViolationError
 
 from tomodachi.core import CogMixin, TomodachiContext
 
@@ -20,31 +19,68 @@ class Owner(CogMixin, colour=0x5865F2, icon=discord.PartialEmoji(name="developer
 
     @commands.command(aliases=["block", "bl"])
     async def blacklist(self, ctx: TomodachiContext, target: discord.User, *, reason: str = "Just because."):
-        async with self.bot.db.pool.acquire() as conn:
-            async with conn.transaction():
-                query = "INSERT INTO blacklisted (user_id, reason) VALUES ($1, $2);"
-
-                try:
-                    await conn.execute(query, target.id, reason)
-                except UniqueViolationError:
-                    await ctx.send(f":thinking_face: **{target}** (`{target.id}`) is already blacklisted.")
-                else:
-                    await ctx.send(f":ok_hand: **{target}** (`{target.id}`) is blacklisted now.")
-
-            await self.bot.fetch_blacklist()
+        if await self.bot.blacklist.add(target.id, reason):
+            await ctx.send(f":ok_hand: **{target}** (`{target.id}`) is blacklisted now.")
+        else:
+            await ctx.send(f":thinking_face: **{target}** (`{target.id}`) is already blacklisted.")
 
     @commands.command(aliases=["unblock", "unbl"])
     async def unblacklist(self, ctx: TomodachiContext, target: discord.User):
-        async with self.bot.db.pool.acquire() as conn:
-            query = "DELETE FROM blacklisted WHERE user_id = $1 RETURNING true;"
-            value = await conn.fetchval(query, target.id)
-
-        if value:
-            await self.bot.fetch_blacklist()
+        if await self.bot.blacklist.remove(target.id):
             await ctx.send(f":ok_hand: **{target}** (`{target.id}`) is not blacklisted anymore.")
         else:
             await ctx.send(f":thinking_face: **{target}** (`{target.id}`) is not on the blacklist.")
 
+    @commands.command(aliases=["sched"])
+    async def scheduler(self, ctx: TomodachiContext):
+        """Shows how accurately the action scheduler fires"""
+        actions = self.bot.actions
+        lines = ["source   count      p50      p95      p99      max"]
+
+        for source, h in actions.fire_lag.items():
+            lines.append(
+                f"{source:<8} {h.count:>5} {h.percentile(50):>7.3f}s {h.percentile(95):>7.3f}s "
+                f"{h.percentile(99):>7.3f}s {h.max:>7.3f}s"
+            )
+
+        lines.append("")
+        for op, h in actions.db_time.items():
+            lines.append(
+                f"db {op:<13} {h.count:>5} calls, mean {h.mean * 1000:.1f}ms, p99 {h.percentile(99) * 1000:.1f}ms"
+            )
+
+        lines.extend(
+            [
+                "",
+                f"queued {len(actions.queued)}, short {len(actions.short_actions)}, "
+                f"p95 depth {actions.queue_depth.percentile(95):.0f}",
+                f"fired {actions.actions_fired} actions in {actions.batches_fired} batches",
+                f"refills {actions.refills.value}, wakeups {actions.wakeups.value}, restarts {actions.restarts.value}",
+                f"catch-up {actions.backlog_drained}/{actions.backlog} at {actions.drain_rate:.1f}/s",
+                f"prefix rejection rate {self.bot.prefixes.rejection_rate:.1%}",
+            ]
+        )
+
+        await ctx.send("```\n{}\n```".format("\n".join(lines)))
+
+    @commands.command()
+    async def latency(self, ctx: TomodachiContext, *, command: str = None):
+        """Shows how long each stage of handling commands takes, for one command or all of them"""
+        histograms = self.bot.tracer.histograms(command)
+        if command is None:
+            # the full breakdown of every command wouldn't fit into one message
+            histograms = {key: h for key, h in histograms.items() if key[1] == "total"}
+
+        if not histograms:
+            return await ctx.send(":x: Nothing was recorded yet.")
+
+        lines = [f"{'command':<20} {'stage':<22} {'count':>6} {'p50':>8} {'p95':>8} {'p99':>8}"]
+        for (name, stage), h in sorted(histograms.items(), key=lambda item: (-item[1].count, item[0]))[:25]:
+            p50, p95, p99 = (h.percentile(q) * 1000 for q in (50, 95, 99))
+            lines.append(f"{name[:20]:<20} {stage[:22]:<22} {h.count:>6} {p50:>6.1f}ms {p95:>6.1f}ms {p99:>6.1f}ms")
+
+        await ctx.send("```\n{}\n```".format("\n".join(lines)))
+
     @commands.command()
     async def steal_avatar(self, ctx: TomodachiContext, user: discord.User):
         """Sets someone's avatar as bots' avatar"""
@@ -308,29 +308,29 @@ class Tools(CogMixin, icon="\N{FILE FOLDER}", colour=0x55ACEE):
     @reminder.command(name="remove", aliases=["rmv", "delete", "del"], help="Remove some reminder from your list")
     async def reminder_remove(self, ctx: TomodachiContext, reminder_id: EntryID):
         async with self.bot.db.pool.acquire() as conn:
-            query = "DELETE FROM actions WHERE author_id=$1 AND id=$2 AND action_type='REMINDER' RETURNING true;"
+            query = "DELETE FROM actions WHERE author_id=$1 AND id=$2 AND action_type='REMINDER' RETURNING id;"
             value = await conn.fetchval(query, ctx.author.id, reminder_id)
 
         if not value:
             return await ctx.send(f":x: Nothing happened. Most likely you don't have a reminder `#{reminder_id}`.")
 
-        await self.bot.actions.redispatch()
+        self.bot.actions.cancel(value)
         await ctx.send(f":ok_hand: Successfully deleted `#{reminder_id}` reminder.")
 
     @reminder.command(name="purge", aliases=["clear"])
     async def reminder_purge(self, ctx: TomodachiContext):
         async with self.bot.db.pool.acquire() as conn:
-            query = """WITH deleted AS (DELETE FROM actions WHERE author_id=$1 AND action_type='REMINDER' RETURNING *)
-                SELECT count(*)
+            query = """WITH deleted AS (DELETE FROM actions WHERE author_id=$1 AND action_type='REMINDER' RETURNING id)
+                SELECT array_agg(id)
                 FROM deleted;"""
             stmt = await conn.prepare(query)
-            count: int = await stmt.fetchval(ctx.author.id)
+            deleted = await stmt.fetchval(ctx.author.id)
 
-        if not count:
+        if not deleted:
             return await ctx.send(":x: Nothing happened. Looks like you have no reminders.")
 
-        await self.bot.actions.redispatch()
-        await ctx.send(f":ok_hand: Deleted `{count}` reminder(s) from your list.")
+        self.bot.actions.cancel(*deleted)
+        await ctx.send(f":ok_hand: Deleted `{len(deleted)}` reminder(s) from your list.")
 
 
 def setup(bot):
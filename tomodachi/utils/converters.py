@@ -12,7 +12,15 @@ from discord.ext import commands
 
 class BannedUser(commands.Converter, discord.User):
     async def convert(self, ctx, argument: str):
-        user = await commands.UserConverter().convert(ctx, argument)
+        if argument.isdigit():
+            # raw IDs go through the bot's resolver, which remembers fetched users
+            try:
+                user = await ctx.bot.resolver.user(int(argument))
+            except discord.NotFound:
+                raise commands.UserNotFound(argument)
+        else:
+            user = await commands.UserConverter().convert(ctx, argument)
+
         try:
             await ctx.guild.fetch_ban(user)
         except discord.NotFound:
@@ -6,8 +6,10 @@
 from __future__ import annotations
 
 import asyncio
-from typing import TYPE_CHECKING, Any, Union, Optional
+import logging
+from typing import TYPE_CHECKING, Any, Set, Dict, List, Union, Callable, Optional, Sequence, Awaitable
 
+import asyncpg
 from databases import Database
 
 from config import POSTGRES_DSN
@@ -18,6 +20,11 @@ if TYPE_CHECKING:
 
 __all__ = ["db"]
 
+log = logging.getLogger(__name__)
+
+NotificationCallback = Callable[[str], Awaitable[Any]]
+ResyncCallback = Callable[[], Awaitable[Any]]
+
 
 class TomodachiDatabase(Database):
     SUPPORTED_BACKENDS = {
@@ -28,6 +35,16 @@ class TomodachiDatabase(Database):
         super().__init__(url, **options)
         self.connection_created = asyncio.Event()
 
+        # dedicated connection for LISTEN, pooled ones can't keep subscriptions
+        self.listener: Optional[asyncpg.Connection] = None
+        self.listener_task: Optional[asyncio.Task] = None
+        self.subscriptions: Dict[str, List[NotificationCallback]] = {}
+        # notifications sent while LISTEN was disconnected are lost, these rebuild whatever they kept coherent
+        self.resync_callbacks: List[ResyncCallback] = []
+        # payloads waiting for the drain task of their channel, and every task started for callbacks
+        self.pending: Dict[str, List[str]] = {}
+        self.tasks: Set[asyncio.Task] = set()
+
     @property
     def pool(self) -> Optional[Pool]:
         return self._backend._pool  # noqa
@@ -38,8 +55,89 @@ class TomodachiDatabase(Database):
 
     async def disconnect(self) -> None:
         self.connection_created.clear()
+
+        if self.listener_task is not None:
+            self.listener_task.cancel()
+            self.listener_task = None
+
+        for task in self.tasks:
+            task.cancel()
+
+        if self.listener is not None and not self.listener.is_closed():
+            await self.listener.close()
+
         await super().disconnect()
 
+    def _spawn(self, coro: Awaitable[Any]):
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self._on_task_done)
+
+    def _on_task_done(self, task: asyncio.Task):
+        self.tasks.discard(task)
+        if not task.cancelled() and (exc := task.exception()) is not None:
+            log.error("database callback failed", exc_info=exc)
+
+    def _on_notification(self, _conn, _pid, channel: str, payload: str):
+        # bursts of notifications are handled by a single task per channel, in the order they were sent
+        if channel in self.pending:
+            self.pending[channel].append(payload)
+            return
+
+        self.pending[channel] = [payload]
+        self._spawn(self._drain(channel))
+
+    async def _drain(self, channel: str):
+        try:
+            while self.pending[channel]:
+                payloads, self.pending[channel] = self.pending[channel], []
+                # identical payloads are applied once, at the position of the last one
+                for payload in reversed(dict.fromkeys(reversed(payloads))):
+                    for callback in self.subscriptions.get(channel, []):
+                        try:
+                            await callback(payload)
+                        except Exception:  # noqa
+                            log.exception("failed to handle notification on channel %s", channel)
+        finally:
+            del self.pending[channel]
+
+    async def _connect_listener(self):
+        self.listener = await asyncpg.connect(str(self.url))
+        for channel in self.subscriptions:
+            await self.listener.add_listener(channel, self._on_notification)
+
+    async def _watch_listener(self):
+        while True:
+            await asyncio.sleep(5.0)
+            if not self.listener.is_closed():
+                continue
+
+            log.warning("LISTEN connection was closed, reconnecting")
+            try:
+                await self._connect_listener()
+            except (OSError, asyncpg.PostgresError):
+                log.exception("failed to reconnect LISTEN connection")
+                continue
+
+            for callback in self.resync_callbacks:
+                self._spawn(callback())
+
+    async def listen(self, /, channel: str, callback: NotificationCallback):
+        """Calls the callback with payload of every NOTIFY sent to the channel"""
+        if self.listener is None:
+            await self._connect_listener()
+            self.listener_task = asyncio.create_task(self._watch_listener())
+
+        if channel not in self.subscriptions:
+            self.subscriptions[channel] = []
+            await self.listener.add_listener(channel, self._on_notification)
+
+        self.subscriptions[channel].append(callback)
+
+    def on_resync(self, /, callback: ResyncCallback):
+        """Calls the callback every time LISTEN reconnects, as notifications might have been missed meanwhile"""
+        self.resync_callbacks.append(callback)
+
     async def store_guild(self, /, guild_id: int):
         async with self.pool.acquire() as conn:
             async with conn.transaction():
@@ -49,6 +147,14 @@ class TomodachiDatabase(Database):
                     query = "insert into mod_settings(guild_id) values ($1) on conflict do nothing;"
                     await conn.execute(query, guild_id)
 
+    async def store_guilds(self, /, guild_ids: Sequence[int]):
+        async with self.pool.acquire() as conn:
+            query = """with inserted as (
+                    insert into guilds (guild_id) select unnest($1::bigint[]) on conflict do nothing returning guild_id
+                )
+                insert into mod_settings (guild_id) select guild_id from inserted on conflict do nothing;"""
+            await conn.execute(query, list(guild_ids))
+
     async def update_prefix(self, /, guild_id: int, new_prefix: str):
         async with self.pool.acquire() as conn:
             query = "UPDATE guilds SET prefix = $1 WHERE guild_id = $2 RETURNING prefix;"
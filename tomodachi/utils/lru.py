@@ -0,0 +1,67 @@
+#  Copyright (c) 2020 — present, Kirill M.
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import time
+from typing import Any, Generic, TypeVar, Hashable, Optional
+from collections import OrderedDict
+
+__all__ = ["LRUCache"]
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+_MISSING: Any = object()
+
+
+class LRUCache(Generic[K, V]):
+    """Bounded mapping which evicts least recently used entries and expires stale ones."""
+
+    __slots__ = ("maxsize", "ttl", "_data")
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[K, tuple[float, V]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: K) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def get(self, key: K, default: Any = None) -> Any:
+        try:
+            expires_at, value = self._data[key]
+        except KeyError:
+            return default
+
+        if expires_at and expires_at <= time.monotonic():
+            del self._data[key]
+            return default
+
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: K, value: V, *, ttl: Optional[float] = None) -> None:
+        ttl = ttl if ttl is not None else self.ttl
+        expires_at = time.monotonic() + ttl if ttl else 0.0
+
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: K, default: Any = None) -> Any:
+        try:
+            _, value = self._data.pop(key)
+        except KeyError:
+            return default
+        return value
+
+    def clear(self) -> None:
+        self._data.clear()
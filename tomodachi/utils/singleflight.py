@@ -0,0 +1,48 @@
+#  Copyright (c) 2020 — present, Kirill M.
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import asyncio
+from typing import Dict, Generic, TypeVar, Callable, Hashable, Awaitable
+
+__all__ = ["SingleFlight"]
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class SingleFlight(Generic[K, V]):
+    """Runs one call per key at a time, callers which come while it runs share its outcome."""
+
+    __slots__ = ("_inflight",)
+
+    def __init__(self) -> None:
+        self._inflight: Dict[K, asyncio.Future] = {}
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._inflight
+
+    async def run(self, key: K, func: Callable[[], Awaitable[V]]) -> V:
+        if (future := self._inflight.get(key)) is not None:
+            # cancelling one of the waiters doesn't cancel the call
+            return await asyncio.shield(future)
+
+        future = self._inflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # marking the exception as retrieved in case nobody else was waiting
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._inflight[key]
@@ -0,0 +1,83 @@
+#  Copyright (c) 2020 — present, Kirill M.
+#  This Source Code Form is subject to the terms of the Mozilla Public
+#  License, v. 2.0. If a copy of the MPL was not distributed with this
+#  file, You can obtain one at https://mozilla.org/MPL/2.0/.
+
+from __future__ import annotations
+
+import math
+import asyncio
+import logging
+from typing import Any, List, Tuple, Generic, TypeVar, Callable, Optional
+
+__all__ = ["TimingWheel"]
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class TimingWheel(Generic[T]):
+    """Fires items after a delay using one ticker task, no matter how many items are pending.
+
+    Every slot covers ``resolution`` seconds, items are never fired early but may be late by up to
+    one resolution. Delays longer than a full turn of the wheel wait for several rounds."""
+
+    def __init__(self, callback: Callable[[List[T]], Any], *, slots: int = 60, resolution: float = 1.0) -> None:
+        self.callback = callback
+        self.resolution = resolution
+        self.slots: List[List[Tuple[int, T]]] = [[] for _ in range(slots)]
+        self.position = 0
+        # loop time the wheel was at the current position, delays are counted from it
+        self.last_tick = 0.0
+        self.task: Optional[asyncio.Task] = None
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, delay: float, item: T):
+        loop = asyncio.get_running_loop()
+        if self.task is None:
+            self.last_tick = loop.time()
+            self.task = asyncio.create_task(self.ticker())
+
+        # part of the current tick has passed already, it doesn't count towards the delay
+        ticks = max(math.ceil((delay + loop.time() - self.last_tick) / self.resolution), 1)
+        slot = (self.position + ticks) % len(self.slots)
+        rounds = (ticks - 1) // len(self.slots)
+
+        self.slots[slot].append((rounds, item))
+        self._size += 1
+
+    def tick(self):
+        self.position = (self.position + 1) % len(self.slots)
+        slot = self.slots[self.position]
+        if not slot:
+            return
+
+        due = [item for rounds, item in slot if rounds == 0]
+        self.slots[self.position] = [(rounds - 1, item) for rounds, item in slot if rounds > 0]
+        self._size -= len(due)
+
+        if due:
+            try:
+                self.callback(due)
+            except Exception:  # noqa
+                log.exception("timing wheel callback failed")
+
+    async def ticker(self):
+        loop = asyncio.get_running_loop()
+        next_tick = self.last_tick
+
+        while True:
+            # ticks are scheduled from the start time, so sleeping late doesn't accumulate drift
+            next_tick += self.resolution
+            await asyncio.sleep(max(next_tick - loop.time(), 0))
+            self.last_tick = next_tick
+            self.tick()
+
+    def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None